@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from polybot.img_proc import Img  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SIZES = {
+    'thumb': (240, 320),
+    '1mp': (768, 1024),
+    '3mp': (1536, 2048),
+    '12mp': (3000, 4000),
+    '24mp': (4000, 6000),
+}
+
+# every Img filter, called the way the bot calls it
+FILTERS = {
+    'blur': lambda img: img.blur(),
+    'blur_101': lambda img: img.blur(101),
+    'rotate': lambda img: img.rotate(),
+    'salt_n_pepper': lambda img: img.salt_n_pepper(),
+    'concat': lambda img: img.concat(img.image_data),
+    'segment': lambda img: img.segment(),
+    'grayscale': lambda img: img.grayscale(),
+    'sharpen': lambda img: img.sharpen(),
+    'emboss': lambda img: img.emboss(),
+    'invert_colors': lambda img: img.invert_colors(),
+    'oil_painting': lambda img: img.oil_painting(),
+    'cartoonize': lambda img: img.cartoonize(),
+}
+
+
+def synthetic_image(height, width, seed=0):
+    # smooth gradients with edges and mild noise, closer to a photo than uniform noise
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.empty((height, width, 3), np.float32)
+    image[..., 0] = 128 + 100 * np.sin(x / max(1, width) * 6.0)
+    image[..., 1] = 255 * y / max(1, height - 1)
+    image[..., 2] = np.where((x // 64 + y // 64) % 2 == 0, 200, 60)
+    image += rng.normal(0, 8, size=image.shape).astype(np.float32)
+    return np.uint8(np.clip(image, 0, 255))
+
+
+def run_filter(name, image_data, repeat, warmup):
+    img = Img.from_array(image_data)
+    func = FILTERS[name]
+    for _ in range(warmup):
+        func(img)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(img)
+        times.append(time.perf_counter() - start)
+        if result is None:
+            raise RuntimeError(f"{name} returned None")
+
+    # peak of the arrays allocated through numpy during one call, OpenCV scratch buffers are not traced
+    tracemalloc.start()
+    func(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    megapixels = image_data.shape[0] * image_data.shape[1] / 1e6
+    mean = float(np.mean(times))
+    return {
+        'repeat': repeat,
+        'mean_ms': round(mean * 1000, 3),
+        'p50_ms': round(float(np.percentile(times, 50)) * 1000, 3),
+        'p90_ms': round(float(np.percentile(times, 90)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(times, 99)) * 1000, 3),
+        'ops_per_s': round(1 / mean, 3),
+        'megapixels_per_s': round(megapixels / mean, 3),
+        'peak_alloc_mb': round(peak / 1e6, 3),
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        ratio = result['p50_ms'] / max(previous['p50_ms'], 1e-6)
+        result['baseline_p50_ms'] = previous['p50_ms']
+        result['ratio'] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every Img filter on synthetic images.")
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES))
+    parser.add_argument('--filters', nargs='+', default=list(FILTERS), choices=list(FILTERS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=None, help="OpenCV worker threads, defaults to all CPUs")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=1.25, help="p50 ratio above which a result regressed")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads if args.threads is not None else cv2.getNumberOfCPUs())
+
+    results = {}
+    for size in args.sizes:
+        image_data = synthetic_image(*SIZES[size])
+        for name in args.filters:
+            results[f'{name}/{size}'] = run_filter(name, image_data, args.repeat, args.warmup)
+            print(f"{name:>14} {size:>6} p50 {results[f'{name}/{size}']['p50_ms']:>10.2f} ms", file=sys.stderr)
+
+    report = {
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'opencv_threads': cv2.getNumThreads(),
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if regressions:
+        print(f"Regressions above {args.threshold}x baseline: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import sys
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from polybot.img_proc import CARTOONIZE_PRESETS, Img  # noqa: E402
+from benchmarks.bench_filters import SIZES, synthetic_image  # noqa: E402
+from benchmarks.segment_compare import psnr, timed  # noqa: E402
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'polybot', 'test', 'beatles.jpeg')
+
+
+def compare(name, img, repeat):
+    exact, exact_time = timed(lambda: img.cartoonize('exact'), repeat)
+    report = {'image': name, 'shape': list(img.image_data.shape), 'exact_ms': round(exact_time * 1000, 2),
+              'presets': []}
+    for quality in CARTOONIZE_PRESETS:
+        if quality == 'exact':
+            continue
+        result, seconds = timed(lambda: img.cartoonize(quality), repeat)
+        report['presets'].append({
+            'quality': quality,
+            **CARTOONIZE_PRESETS[quality],
+            'ms': round(seconds * 1000, 2),
+            'speedup': round(exact_time / seconds, 1),
+            'psnr_vs_exact': round(psnr(result, exact), 2),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the cartoonize presets against the exact filter.")
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    parser.add_argument('--sizes', nargs='+', default=['3mp', '12mp'], choices=list(SIZES),
+                        help="synthetic image sizes compared besides --image")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    reports = [compare(os.path.basename(args.image), Img(args.image), args.repeat)]
+    for size in args.sizes:
+        reports.append(compare(size, Img.from_array(synthetic_image(*SIZES[size])), args.repeat))
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    cv2.setNumThreads(cv2.getNumberOfCPUs())
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from polybot.img_proc import Img  # noqa: E402
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'polybot', 'test', 'beatles.jpeg')
+
+
+def psnr(a, b):
+    mse = np.mean((np.float64(a) - np.float64(b)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def timed(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fast and exact Img.segment paths.")
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    parser.add_argument('--clusters', type=int, default=100)
+    parser.add_argument('--exact-attempts', type=int, default=10)
+    parser.add_argument('--sample-sizes', type=int, nargs='+', default=[5000, 20000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    img = Img(args.image)
+    # Both paths darken by 50%, so measure quantization error against the darkened original
+    reference = np.float64(img.image_data) * 0.5
+
+    exact, exact_time = timed(lambda: img.segment(args.clusters, method='exact', attempts=args.exact_attempts), 1)
+    report = {
+        'image': os.path.basename(args.image),
+        'shape': list(img.image_data.shape),
+        'clusters': args.clusters,
+        'exact': {'seconds': round(exact_time, 4), 'psnr_vs_original': round(psnr(exact, reference), 2)},
+        'fast': [],
+    }
+
+    for sample_size in args.sample_sizes:
+        for sampling in ['random', 'strided']:
+            fast, fast_time = timed(lambda: img.segment(args.clusters, sample_size=sample_size,
+                                                        sampling=sampling, seed=0), args.repeat)
+            report['fast'].append({
+                'sample_size': sample_size,
+                'sampling': sampling,
+                'seconds': round(fast_time, 4),
+                'speedup': round(exact_time / fast_time, 1),
+                'psnr_vs_original': round(psnr(fast, reference), 2),
+                'psnr_vs_exact': round(psnr(fast, exact), 2),
+                'colors': int(len(np.unique(fast.reshape((-1, 3)), axis=0))),
+            })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    cv2.setNumThreads(cv2.getNumberOfCPUs())
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from polybot.img_proc import Img, apply_filter, apply_filter_shared  # noqa: E402
+from polybot.shared_images import SharedImagePool  # noqa: E402
+from polybot.worker_pool import FilterWorkerPool  # noqa: E402
+from benchmarks.bench_filters import SIZES, synthetic_image  # noqa: E402
+
+
+def apply_filter_array(image_data, method_name):
+    # the pickled transport: the decoded image goes to the worker and the result comes back by value
+    return getattr(Img.from_array(image_data), method_name)()
+
+
+def median_ms(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2)
+
+
+def compare(size, method_name, workers, images, repeat):
+    image_data = synthetic_image(*SIZES[size])
+    image_bytes = cv2.imencode('.jpg', image_data)[1].tobytes()
+
+    def pickled():
+        return workers.submit('bench', apply_filter_array, image_data, method_name).result()
+
+    def shared():
+        # the handler copies the decoded image into a pooled segment, the worker writes the result into another
+        source, target = images.from_array(image_data), images.acquire(image_data.shape)
+        job = workers.submit('bench', apply_filter_shared, source, target, method_name, resources=[source, target])
+        job.result()
+        return target.array()
+
+    def encoded():
+        return workers.submit('bench', apply_filter, image_bytes, method_name).result()
+
+    return {
+        'size': size,
+        'megapixels': round(image_data.shape[0] * image_data.shape[1] / 1e6, 2),
+        'decoded_mb': round(image_data.nbytes / 1e6, 1),
+        'filter_ms': median_ms(lambda: apply_filter_array(image_data, method_name), repeat),
+        'pickled_ms': median_ms(pickled, repeat),
+        'shared_ms': median_ms(shared, repeat),
+        'encoded_bytes_ms': median_ms(encoded, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare image transports between the bot and its filter workers.")
+    parser.add_argument('--sizes', nargs='+', default=['thumb', '1mp', '3mp', '12mp'], choices=list(SIZES))
+    parser.add_argument('--filter', default='invert_colors')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    workers = FilterWorkerPool(max_workers=1, timeout=0)
+    images = SharedImagePool(max_bytes=1024 * 1024 * 1024)
+    try:
+        print(json.dumps([compare(size, args.filter, workers, images, args.repeat) for size in args.sizes], indent=2))
+    finally:
+        workers.shutdown()
+        images.close()
+
+
+if __name__ == '__main__':
+    main()
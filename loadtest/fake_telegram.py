@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+import time
+from aiohttp import web
+
+
+class FakeTelegramAPI:
+    # A local stand-in for the Telegram Bot API: serves getFile and file downloads for the photos
+    # registered with add_file, records every sendPhoto/sendMessage call and hands the updates given
+    # to push_update to a polling bot. Point the bot at it with TELEGRAM_API_URL=http://host:port
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.files = {}
+        self.sent = []
+        self.calls = {}
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sent_event = threading.Condition(self._lock)
+        # chat id -> its records in sent, for waiting on the replies to one chat
+        self._sent_by_chat = {}
+        self._updates = []
+        self._updates_event = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self.url = None
+
+    def add_file(self, file_id, data):
+        file_unique_id = hashlib.sha1(data).hexdigest()[:16]
+        self.files[file_id] = {'file_unique_id': file_unique_id, 'file_path': f'photos/{file_id}.jpg', 'data': data}
+        return file_unique_id
+
+    def photo_size(self, file_id, width, height):
+        return {'file_id': file_id, 'file_unique_id': self.files[file_id]['file_unique_id'],
+                'file_size': len(self.files[file_id]['data']), 'width': width, 'height': height}
+
+    def sent_to(self, chat_id):
+        with self._lock:
+            return list(self._sent_by_chat.get(chat_id, ()))
+
+    def wait_for_chat(self, chat_id, count, timeout=30):
+        # waits until the bot sent count messages to the chat, returns them or None on timeout
+        deadline = time.time() + timeout
+        with self._sent_event:
+            while len(self._sent_by_chat.get(chat_id, ())) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._sent_event.wait(remaining)
+            return list(self._sent_by_chat[chat_id])
+
+    def push_update(self, update):
+        # queues an update (a dict or its JSON) for getUpdates
+        update = json.loads(update) if isinstance(update, str) else update
+        with self._lock:
+            self._updates.append(update)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._updates_event.set)
+
+    def wait_for_sent(self, count, timeout=30):
+        deadline = time.time() + timeout
+        with self._sent_event:
+            while len(self.sent) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._sent_event.wait(remaining)
+        return True
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        return app
+
+    async def handle_method(self, request):
+        method = request.match_info['method']
+        params = dict(request.query)
+        if request.can_read_body:
+            form = await request.post()
+            for key, value in form.items():
+                params[key] = value.file.read() if hasattr(value, 'file') else value
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = getattr(self, f'_method_{method}', None)
+        if handler is None:
+            return web.json_response({'ok': False, 'error_code': 404, 'description': f'Not Found: {method}'},
+                                     status=404)
+        result = handler(params)
+        if asyncio.iscoroutine(result):
+            result = await result
+        if isinstance(result, web.Response):
+            return result
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.match_info['path']
+        for info in self.files.values():
+            if info['file_path'] == path:
+                return web.Response(body=info['data'], content_type='image/jpeg')
+        return web.Response(status=404)
+
+    def _message(self, chat_id, **content):
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                   'chat': {'id': int(chat_id), 'type': 'private'}}
+        message.update(content)
+        return message
+
+    def _record(self, method, params, size=0):
+        record = {'method': method, 'chat_id': int(params['chat_id']), 'time': time.time(), 'bytes': size,
+                  'text': params.get('text')}
+        with self._sent_event:
+            self.sent.append(record)
+            self._sent_by_chat.setdefault(record['chat_id'], []).append(record)
+            self._sent_event.notify_all()
+
+    def _method_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+    def _method_setWebhook(self, params):
+        return True
+
+    def _method_deleteWebhook(self, params):
+        return True
+
+    async def _method_getUpdates(self, params):
+        # long polling, answered as soon as an update is queued; confirmed updates (below offset) are dropped
+        offset = int(params.get('offset') or 0)
+        deadline = time.time() + min(float(params.get('timeout') or 0), 1.0)
+        while True:
+            with self._lock:
+                self._updates = [update for update in self._updates if update['update_id'] >= offset]
+                updates = self._updates[:int(params.get('limit') or 100)]
+                self._updates_event.clear()
+            remaining = deadline - time.time()
+            if updates or remaining <= 0:
+                return updates
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _method_getFile(self, params):
+        info = self.files.get(params.get('file_id'))
+        if info is None:
+            return web.json_response({'ok': False, 'error_code': 400, 'description': 'Bad Request: invalid file_id'},
+                                     status=400)
+        return {'file_id': params['file_id'], 'file_unique_id': info['file_unique_id'],
+                'file_size': len(info['data']), 'file_path': info['file_path']}
+
+    def _method_sendPhoto(self, params):
+        photo = params.get('photo', b'')
+        self._record('sendPhoto', params, len(photo) if isinstance(photo, bytes) else 0)
+        return self._message(params['chat_id'], photo=[{'file_id': 'sent', 'file_unique_id': 'sent',
+                                                        'width': 1, 'height': 1}])
+
+    def _method_sendVideo(self, params):
+        video = params.get('video', b'')
+        self._record('sendVideo', params, len(video) if isinstance(video, bytes) else 0)
+        return self._message(params['chat_id'], video={'file_id': 'sent', 'file_unique_id': 'sent', 'width': 1,
+                                                       'height': 1, 'duration': 1})
+
+    def _method_sendMediaGroup(self, params):
+        media = json.loads(params.get('media', '[]'))
+        size = sum(len(params[item['media'][len('attach://'):]]) for item in media
+                   if item['media'].startswith('attach://') and item['media'][len('attach://'):] in params)
+        self._record('sendMediaGroup', params, size)
+        return [self._message(params['chat_id'], photo=[{'file_id': 'sent', 'file_unique_id': 'sent',
+                                                         'width': 1, 'height': 1}]) for _ in media]
+
+    def _method_sendMessage(self, params):
+        self._record('sendMessage', params)
+        return self._message(params['chat_id'], text=params.get('text', ''))
+
+    def start(self, host='127.0.0.1', port=0):
+        # runs the server on its own event loop thread, so blocking bot code can call it
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._updates_event = asyncio.Event()
+            self._runner = web.AppRunner(self.make_app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, host, port)
+            self._loop.run_until_complete(site.start())
+            bound_port = site._server.sockets[0].getsockname()[1]
+            self.url = f'http://{host}:{bound_port}'
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+
+def make_update(update_id, chat_id, text=None, photo=None, caption=None, media_group_id=None):
+    message = {'message_id': update_id, 'date': int(time.time()),
+               'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+               'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}}
+    if text is not None:
+        message['text'] = text
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    if photo is not None:
+        message['photo'] = photo
+    if caption is not None:
+        message['caption'] = caption
+    if media_group_id is not None:
+        message['media_group_id'] = media_group_id
+    return json.dumps({'update_id': update_id, 'message': message})
@@ -0,0 +1,328 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loadtest.fake_telegram import FakeTelegramAPI, make_update  # noqa: E402
+from loadtest.webhook_load import DEFAULT_IMAGE, ROOT, wait_until_up  # noqa: E402
+
+# share of each kind of interaction in generated traffic
+DEFAULT_MIX = {'filter': 0.5, 'heavy_filter': 0.1, 'concat': 0.2, 'album': 0.08, 'preview': 0.04, 'invalid': 0.08}
+CHEAP_FILTERS = ['Blur', 'Blur 5', 'Blur 31 box', 'Grayscale', 'Sharpen', 'Emboss', 'Invert', 'Rotate',
+                 'Salt and pepper 0.1']
+HEAVY_FILTERS = ['Cartoonize', 'Cartoonize fast', 'Oil painting', 'Segment 16']
+INVALID_COMMANDS = ['Blur 999', 'Segment 1', 'Oil painting size=1', 'Cartoonize quality=best']
+# every photo is offered in these sizes (longest side), like Telegram does
+PHOTO_SIDES = [320, 800, 1280]
+# the bot's answer to each kind of command
+EXPECTED_REPLY = {'filter': 'sendPhoto', 'heavy_filter': 'sendPhoto', 'concat': 'sendPhoto',
+                  'album': 'sendMediaGroup', 'preview': 'sendMediaGroup', 'invalid': 'sendMessage'}
+
+
+def generate_traffic(chats, interactions, mix=None, seed=0, ramp=5.0, think=1.0):
+    # A seeded script of interactions: every one has setup updates (a photo or an album, acknowledged once)
+    # and the measured commands. 'at' is the earliest start in seconds; a chat runs its interactions in order.
+    rng = random.Random(seed)
+    kinds, weights = zip(*(mix or DEFAULT_MIX).items())
+    photo_ids = itertools.count()
+    script = []
+    for chat in range(chats):
+        chat_id = 1000 + chat
+        at = rng.uniform(0, ramp)
+        for index in range(interactions):
+            kind = rng.choices(kinds, weights)[0]
+            setup = [{'photo': f'p{next(photo_ids)}'}]
+            commands = [{'kind': kind, 'text': rng.choice(CHEAP_FILTERS)}]
+            if kind == 'heavy_filter':
+                commands = [{'kind': kind, 'text': rng.choice(HEAVY_FILTERS)}]
+            elif kind == 'concat':
+                commands = [{'kind': kind, 'photo': f'p{next(photo_ids)}'}]
+            elif kind == 'album':
+                setup = [{'photo': f'p{next(photo_ids)}', 'media_group_id': f'{chat_id}-{index}'}
+                         for _ in range(rng.randint(2, 4))]
+            elif kind == 'preview':
+                # the preview keeps the photo, which the user then filters
+                commands = [{'kind': kind, 'text': '/preview'}, {'kind': 'filter', 'text': rng.choice(CHEAP_FILTERS)}]
+            elif kind == 'invalid':
+                # parameters are validated before the pending image is looked at, so no photo is needed
+                setup, commands = [], [{'kind': kind, 'text': rng.choice(INVALID_COMMANDS)}]
+            script.append({'chat_id': chat_id, 'at': round(at, 3), 'kind': kind, 'setup': setup, 'commands': commands})
+            at += rng.expovariate(1 / think) if think > 0 else 0
+    return script
+
+
+def save_traffic(script, path):
+    with open(path, 'w') as f:
+        for interaction in script:
+            f.write(json.dumps(interaction) + '\n')
+
+
+def load_traffic(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def photo_variants(image_path):
+    # the test photo at every offered size, encoded once
+    image = cv2.imread(image_path)
+    variants = {}
+    for side in PHOTO_SIDES:
+        scale = side / max(image.shape[:2])
+        resized = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+        variants[side] = (cv2.imencode('.jpg', resized)[1].tobytes(), resized.shape[1], resized.shape[0])
+    return variants
+
+
+def register_photos(api, script, variants):
+    # Trailing bytes are ignored by JPEG decoders but make every photo unique, so results are
+    # never served from the bot's cache. Returns photo id -> the sizes of its update.
+    photos = {}
+    for interaction in script:
+        for update in interaction['setup'] + interaction['commands']:
+            photo_id = update.get('photo')
+            if photo_id is None or photo_id in photos:
+                continue
+            photos[photo_id] = []
+            for side, (data, width, height) in variants.items():
+                file_id = f'{photo_id}-{side}'
+                api.add_file(file_id, data + file_id.encode())
+                photos[photo_id].append(api.photo_size(file_id, width, height))
+    return photos
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        # nearest-rank percentile
+        return round(values[max(0, -(-len(values) * p // 100) - 1)] * 1000, 1)
+
+    return {'count': len(values), 'p50': rank(50), 'p90': rank(90), 'p99': rank(99),
+            'max': round(values[-1] * 1000, 1), 'mean': round(sum(values) / len(values) * 1000, 1)}
+
+
+def classify(expected, reply):
+    if reply is None:
+        return 'no_reply'
+    if reply['method'] == expected:
+        return 'ok'
+    text = reply['text'] or ''
+    if text.startswith('The bot is busy'):
+        return 'busy'
+    if 'took too long' in text:
+        return 'timeout'
+    return 'error'
+
+
+class Replay:
+    # Plays a script against the bot through the fake API: updates are posted to the webhook, or queued
+    # for getUpdates in polling mode, and every command is matched to the next message the bot sends to
+    # its chat. A webhook answering 503 gets the update again after a second, like Telegram does.
+    # The rest of an interaction is skipped once a command failed, and the chat's later interactions
+    # continue in a fresh chat, since a failed command can leave a photo pending (a busy /preview does).
+
+    def __init__(self, api, photos, webhook=None, reply_timeout=60, redeliver_after=1.0):
+        self.api = api
+        self.photos = photos
+        self.webhook = webhook
+        self.reply_timeout = reply_timeout
+        self.redeliver_after = redeliver_after
+        self.results = []
+        self.redeliveries = 0
+        self.failed_deliveries = 0
+        self._update_ids = itertools.count(1)
+        self._fresh_chats = itertools.count(10 ** 6)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def deliver(self, chat_id, update):
+        photo = update.get('photo')
+
+        def make(update_id):
+            return make_update(update_id, chat_id, text=update.get('text'), photo=self.photos[photo] if photo else None,
+                               media_group_id=update.get('media_group_id'))
+
+        if self.webhook is None:
+            # queued in update_id order, or getUpdates would drop an update below the confirmed offset
+            with self._lock:
+                self.api.push_update(make(next(self._update_ids)))
+            return True
+        data = make(next(self._update_ids))
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        deadline = time.time() + self.reply_timeout
+        while time.time() < deadline:
+            try:
+                status = self._local.session.post(self.webhook, data=data, timeout=10).status_code
+            except requests.RequestException:
+                status = None
+            if status == 200:
+                return True
+            with self._lock:
+                self.redeliveries += 1
+            time.sleep(self.redeliver_after)
+        with self._lock:
+            self.failed_deliveries += 1
+        return False
+
+    def run_chat(self, chat_id, interactions, start):
+        for interaction in interactions:
+            time.sleep(max(0.0, start + interaction['at'] - time.time()))
+            received = len(self.api.sent_to(chat_id))
+            for update in interaction['setup']:
+                self.deliver(chat_id, update)
+            if interaction['setup'] and self.api.wait_for_chat(chat_id, received + 1, self.reply_timeout) is None:
+                self._add({'kind': 'setup', 'outcome': 'no_reply'})
+                chat_id = next(self._fresh_chats)
+                continue
+            for command in interaction['commands']:
+                result = {'kind': command['kind'], 'command': command.get('text', 'photo')}
+                received = len(self.api.sent_to(chat_id))
+                sent_at = time.time()
+                self.deliver(chat_id, command)
+                replies = self.api.wait_for_chat(chat_id, received + 1, self.reply_timeout)
+                reply = replies[received] if replies else None
+                result['outcome'] = classify(EXPECTED_REPLY[command['kind']], reply)
+                if reply is not None:
+                    result['latency'] = reply['time'] - sent_at
+                    result['reply'] = reply['text'] if reply['method'] == 'sendMessage' else reply['method']
+                self._add(result)
+                if result['outcome'] != 'ok':
+                    chat_id = next(self._fresh_chats)
+                    break
+
+    def run(self, script, concurrency):
+        chats = {}
+        for interaction in script:
+            chats.setdefault(interaction['chat_id'], []).append(interaction)
+        start = time.time()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(self.run_chat, chat_id, interactions, start)
+                           for chat_id, interactions in chats.items()]:
+                future.result()
+        return time.time() - start
+
+    def _add(self, result):
+        with self._lock:
+            self.results.append(result)
+
+
+def report(results, seconds):
+    outcomes = {}
+    for result in results:
+        outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+    ok = [result for result in results if result['outcome'] == 'ok']
+    latency = {'all': percentiles([result['latency'] for result in ok])}
+    for kind in EXPECTED_REPLY:
+        values = [result['latency'] for result in ok if result['kind'] == kind]
+        if values:
+            latency[kind] = percentiles(values)
+    errors = {}
+    for result in results:
+        if result['outcome'] != 'ok':
+            reply = result.get('reply', result['outcome'])
+            errors[reply] = errors.get(reply, 0) + 1
+    return {
+        'interactions': len(results),
+        'seconds': round(seconds, 3),
+        'completed_per_second': round(len(ok) / seconds, 2) if seconds else 0,
+        'outcomes': outcomes,
+        'error_rate': round(1 - len(ok) / len(results), 4) if results else 0,
+        'latency_ms': latency,
+        'errors': dict(sorted(errors.items(), key=lambda item: -item[1])[:10]),
+    }
+
+
+def start_bot(api, mode, port, env_overrides, log):
+    env = dict(os.environ, TELEGRAM_TOKEN='123:fake', TELEGRAM_API_URL=api.url, BOT_MODE=mode,
+               WEBHOOK_PORT=str(port), METRICS_PORT=str(port))
+    env.update(env_overrides)
+    bot = subprocess.Popen([sys.executable, 'bot.py'], cwd=os.path.join(ROOT, 'polybot'), env=env,
+                           stdout=log, stderr=log)
+    if mode == 'webhook':
+        up = wait_until_up(f'http://127.0.0.1:{port}/healthz')
+    else:
+        deadline = time.time() + 30
+        while not api.calls.get('getUpdates') and time.time() < deadline and bot.poll() is None:
+            time.sleep(0.2)
+        up = bool(api.calls.get('getUpdates'))
+    if not up:
+        bot.terminate()
+        raise RuntimeError("bot did not start")
+    return bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay simulated chats against bot.py and a fake Telegram API, "
+                                                 "and report throughput, latency percentiles and error rates.")
+    parser.add_argument('--chats', type=int, default=30)
+    parser.add_argument('--interactions', type=int, default=3, help="interactions per chat")
+    parser.add_argument('--ramp', type=float, default=5.0, help="seconds over which the chats start")
+    parser.add_argument('--think', type=float, default=1.0, help="mean seconds between a chat's interactions")
+    parser.add_argument('--mix', type=json.loads, default=None,
+                        help=f"JSON weights of the interaction kinds, default {json.dumps(DEFAULT_MIX)}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', help="write the generated traffic to this JSON lines file")
+    parser.add_argument('--replay', help="replay traffic from a JSON lines file instead of generating it")
+    parser.add_argument('--concurrency', type=int, default=64, help="chats driven at once")
+    parser.add_argument('--mode', choices=['webhook', 'polling'], default='webhook')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--api-latency', type=float, default=0.05, help="seconds added to every fake API call")
+    parser.add_argument('--reply-timeout', type=float, default=60)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra environment for the bot, e.g. --env WORKER_PROCESSES=4")
+    parser.add_argument('--bot-log', help="file receiving the bot's output")
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    args = parser.parse_args()
+
+    if args.replay:
+        script = load_traffic(args.replay)
+    else:
+        script = generate_traffic(args.chats, args.interactions, args.mix, args.seed, args.ramp, args.think)
+    if args.record:
+        save_traffic(script, args.record)
+
+    api = FakeTelegramAPI(latency=args.api_latency)
+    photos = register_photos(api, script, photo_variants(args.image))
+    api.start()
+    env = dict(item.split('=', 1) for item in args.env)
+    log = open(args.bot_log, 'w') if args.bot_log else subprocess.DEVNULL
+    bot = start_bot(api, args.mode, args.port, env, log)
+    try:
+        webhook = f'http://127.0.0.1:{args.port}/webhook' if args.mode == 'webhook' else None
+        replay = Replay(api, photos, webhook, reply_timeout=args.reply_timeout)
+        seconds = replay.run(script, args.concurrency)
+        result = report(replay.results, seconds)
+        result.update({
+            'mode': args.mode,
+            'chats': len({interaction['chat_id'] for interaction in script}),
+            'redeliveries': replay.redeliveries,
+            'failed_deliveries': replay.failed_deliveries,
+            'sent_mb': round(sum(sent['bytes'] for sent in api.sent) / 1e6, 2),
+            'api_calls': api.calls,
+        })
+        print(json.dumps(result, indent=2))
+    finally:
+        # SIGINT also ends long polling, after which the bot shuts its worker pool down
+        bot.send_signal(signal.SIGINT)
+        bot.wait(timeout=60)
+        api.stop()
+        if args.bot_log:
+            log.close()
+
+
+if __name__ == '__main__':
+    main()
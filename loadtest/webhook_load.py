@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loadtest.fake_telegram import FakeTelegramAPI, make_update  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_IMAGE = os.path.join(ROOT, 'polybot', 'test', 'beatles.jpeg')
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive bot.py in webhook mode against a fake Telegram API.")
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--filter', default='Grayscale')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--api-latency', type=float, default=0.05, help="seconds added to every fake API call")
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(latency=args.api_latency)
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+    api.start()
+
+    env = dict(os.environ, TELEGRAM_TOKEN='123:fake', TELEGRAM_API_URL=api.url, BOT_MODE='webhook',
+               WEBHOOK_PORT=str(args.port), RESULT_CACHE_MB='0')
+    bot = subprocess.Popen([sys.executable, 'bot.py'], cwd=os.path.join(ROOT, 'polybot'), env=env,
+                           stdout=subprocess.DEVNULL)
+    webhook = f'http://127.0.0.1:{args.port}/webhook'
+    try:
+        if not wait_until_up(f'http://127.0.0.1:{args.port}/healthz'):
+            raise RuntimeError("bot did not start")
+
+        # every chat sends its own photo, then the filter command
+        update_ids = iter(range(1, 10 * args.chats))
+        for chat in range(args.chats):
+            api.add_file(f'photo-{chat}', image_bytes + chat.to_bytes(4, 'big'))
+
+        def run_chat(chat):
+            chat_id = 1000 + chat
+            photo = [api.photo_size(f'photo-{chat}', 660, 660)]
+            requests.post(webhook, data=make_update(next(update_ids), chat_id, photo=photo), timeout=10)
+            requests.post(webhook, data=make_update(next(update_ids), chat_id, text=args.filter), timeout=10)
+
+        start = time.time()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            list(executor.map(run_chat, range(args.chats)))
+        # one "first image saved" reply and one photo per chat
+        completed = api.wait_for_sent(2 * args.chats, timeout=120)
+        elapsed = time.time() - start
+
+        photos = [sent for sent in api.sent if sent['method'] == 'sendPhoto']
+        print(json.dumps({
+            'chats': args.chats,
+            'completed': completed,
+            'photos_sent': len(photos),
+            'seconds': round(elapsed, 3),
+            'photos_per_second': round(len(photos) / elapsed, 2),
+            'api_calls': api.calls,
+        }, indent=2))
+    finally:
+        bot.terminate()
+        bot.wait(timeout=60)
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,22 @@
 import os
-import telebot
+import sys
+import time
 import cv2
+import telebot
+from telebot import apihelper
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from dotenv import load_dotenv
-from img_proc import Img
+from loguru import logger
+from filters import default_registry
+from img_proc import Img, apply_filter, apply_filter_batch, apply_filter_shared, apply_filter_video, \
+    collect_timings, concat_images, decode_into, encoding_for, image_size, preview_filters
+from metrics import Metrics
+from result_cache import ResultCache, make_key
+from session_store import InMemorySessionStore, RedisSessionStore
+from shared_images import SharedImagePool
+from telegram_io import MAX_DOWNLOAD_BYTES, TelegramIO
+from webhook_server import WebhookServer
+from worker_pool import FilterWorkerPool, JobTimeoutError, PoolBusyError
 
 # load environment variables
 load_dotenv()
@@ -13,144 +27,378 @@ if not TELEGRAM_TOKEN:
     print("Error: TELEGRAM_TOKEN is not set in the .env file.")
     exit(1)
 
+# point the bot at another Bot API server, e.g. a local fake one for load tests
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+    apihelper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+
+# Updates arrive over long polling, or behind a webhook (BOT_MODE=webhook). The webhook server runs the
+# handlers on its own threads, in order per chat, so telebot must not hand them to its thread pool
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
 # initialize telegram-bot
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=BOT_MODE != 'webhook')
+
+# Photos are downloaded and sent over a pooled, retrying client, with at most TELEGRAM_MAX_CONNECTIONS
+# requests at once and TELEGRAM_PER_CHAT for one chat; the photos of an album download concurrently
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_MAX_CONNECTIONS', 16))
+telegram = TelegramIO(TELEGRAM_TOKEN, TELEGRAM_API_URL or 'https://api.telegram.org',
+                      max_connections=TELEGRAM_MAX_CONNECTIONS, per_chat=int(os.getenv('TELEGRAM_PER_CHAT', 2)),
+                      max_retries=int(os.getenv('TELEGRAM_MAX_RETRIES', 4)))
+downloads = ThreadPoolExecutor(max_workers=TELEGRAM_MAX_CONNECTIONS, thread_name_prefix='download')
+
+# Stage timings are logged at DEBUG level, as JSON lines with LOG_JSON=1
+logger.remove()
+logger.add(sys.stderr, level=os.getenv('LOG_LEVEL', 'INFO'), serialize=os.getenv('LOG_JSON') == '1')
+metrics = Metrics()
+
+# Per-chat state (pending image, album), in process memory or shared between replicas through Redis
+SESSION_TTL = float(os.getenv('SESSION_TTL', 900))
+if os.getenv('SESSION_BACKEND', 'memory') == 'redis':
+    sessions = RedisSessionStore.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), ttl=SESSION_TTL)
+else:
+    sessions = InMemorySessionStore(ttl=SESSION_TTL, max_entries=int(os.getenv('SESSION_MAX_ENTRIES', 10000)),
+                                    on_expire=lambda chat_id, state: print(f"Session of chat {chat_id} expired"))
+
+# filters run in worker processes so a slow one never blocks the polling thread
+pool = FilterWorkerPool(max_workers=int(os.getenv('WORKER_PROCESSES', 0)) or None,
+                        max_queue=int(os.getenv('WORKER_QUEUE_SIZE', 8)),
+                        timeout=float(os.getenv('FILTER_TIMEOUT', 60)))
+
+# With IMAGE_TRANSPORT=shared, handlers decode photos into shared memory and encode the results, and the
+# workers only run the filters, on the shared pixels in place (see benchmarks/transport_compare.py)
+image_pool = SharedImagePool(max_bytes=int(os.getenv('SHARED_IMAGES_MB', 512)) * 1024 * 1024) \
+    if os.getenv('IMAGE_TRANSPORT', 'bytes') == 'shared' else None
+
+# encoded filter results, keyed by the photos' file_unique_id and the filter
+cache = ResultCache(max_bytes=int(os.getenv('RESULT_CACHE_MB', 64)) * 1024 * 1024,
+                    ttl=float(os.getenv('RESULT_CACHE_TTL', 3600)),
+                    directory=os.getenv('RESULT_CACHE_DIR') or None,
+                    disk_max_bytes=int(os.getenv('RESULT_CACHE_DISK_MB', 512)) * 1024 * 1024)
+metrics.watch(pool=pool, cache=cache)
+
+# the filters users can send by name, with their parameters, cost and resolution; installed plugins add theirs
+filters = default_registry()
+filters.load_entry_points()
+
+# /preview renders every filter at this size
+PREVIEW_MAX_SIDE = 640
+
+# GIFs and videos are filtered frame by frame at up to this size, and cut after VIDEO_MAX_FRAMES frames
+VIDEO_MAX_SIDE = int(os.getenv('VIDEO_MAX_SIDE', 720))
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', 900))
+
+# Results are encoded per filter and content (img_proc.ENCODE_PROFILES); these override every profile
+OUTPUT_ENCODING = {}
+if os.getenv('OUTPUT_FORMAT'):
+    OUTPUT_ENCODING['format'] = os.getenv('OUTPUT_FORMAT')
+if os.getenv('OUTPUT_TARGET_KB'):
+    OUTPUT_ENCODING['target_bytes'] = int(os.getenv('OUTPUT_TARGET_KB')) * 1024
+
+
+def photo_ref(message):
+    # only the ids of every size are kept, a photo is downloaded when a filter actually has to run
+    return [{'file_id': photo.file_id, 'file_unique_id': photo.file_unique_id,
+             'width': photo.width, 'height': photo.height} for photo in message.photo]
+
+
+def pick_photo(sizes, max_side=None):
+    # the smallest size covering max_side, the largest one when none does or there is no limit
+    sizes = sorted(sizes, key=lambda size: max(size['width'], size['height']))
+    if max_side:
+        for size in sizes:
+            if max(size['width'], size['height']) >= max_side:
+                return size
+    return sizes[-1]
+
+
+def download_photo(photo, chat_id=None):
+    with metrics.timed('get_file'):
+        file_info = telegram.get_file(photo['file_id'], chat_id)
+    with metrics.timed('download'):
+        return telegram.download(file_info['file_path'], chat_id, file_info.get('file_size'))
+
+
+def download_photos(photos, chat_id=None):
+    return list(downloads.map(lambda photo: download_photo(photo, chat_id), photos))
+
+
+def send_photo(chat_id, image):
+    with metrics.timed('send_photo'):
+        telegram.send_photo(chat_id, image)
+
+
+def send_video(chat_id, video):
+    with metrics.timed('send_video'):
+        telegram.send_video(chat_id, video)
+
+
+def send_cached(message, cache_key, send=send_photo):
+    processed_image = cache.get(cache_key)
+    if processed_image is None:
+        return False
+    send(message.chat.id, processed_image)
+    return True
+
+
+def send_album(chat_id, images, captions=None):
+    # Telegram albums hold at most 10 photos
+    captions = captions or [None] * len(images)
+    media = [(image, caption) for image, caption in zip(images, captions) if image is not None]
+    for start in range(0, len(media), 10):
+        photos, photo_captions = zip(*media[start:start + 10])
+        with metrics.timed('send_photo'):
+            telegram.send_media_group(chat_id, photos, photo_captions)
+
+
+def send_result(message, job_name, cache_key=None, captions=None, send=send_photo, transform=None):
+    # called from the worker pool once a job finished, failed, timed out or was cancelled;
+    # transform turns the worker's result into the bytes to send
+    def callback(job):
+        try:
+            processed_image, observations = job.result()
+            metrics.record(observations)
+            if transform is not None:
+                processed_image = transform(processed_image)
+            if isinstance(processed_image, list) and any(image is not None for image in processed_image):
+                send_album(message.chat.id, processed_image, captions)
+            elif processed_image is not None and not isinstance(processed_image, list):
+                if cache_key is not None:
+                    cache.put(cache_key, processed_image)
+                send(message.chat.id, processed_image)
+            else:
+                bot.reply_to(message, f"Error applying {job_name}: Result is None.")
+        except JobTimeoutError:
+            bot.reply_to(message, f"Applying {job_name} took too long, please try a smaller image.")
+        except CancelledError:
+            print(f"Job {job_name} for chat {message.chat.id} was cancelled")
+        except Exception as e:
+            bot.reply_to(message, f"Error applying {job_name}: {e}")
+    return callback
 
-# Dictionary to store images temporarily
-user_images = {}
+
+def enqueue(message, job_name, func, *args, cache_key=None, captions=None, heavy=False, send=send_photo,
+            transform=None, resources=(), **kwargs):
+    try:
+        # the worker reports its stage timings along with the result
+        pool.submit(message.chat.id, collect_timings, time.time(), func, *args,
+                    callback=send_result(message, job_name, cache_key, captions, send, transform), heavy=heavy,
+                    resources=resources, **kwargs)
+        return True
+    except PoolBusyError:
+        bot.reply_to(message, "The bot is busy right now, please retry in a moment.")
+        return False
+
+
+def enqueue_shared(message, job_name, spec, image_bytes, cache_key, **kwargs):
+    # raises MemoryError when the shared image pool is full
+    with metrics.timed('decode'):
+        source = decode_into(image_bytes, image_pool.acquire, spec.max_side)
+    if source is None:
+        raise ValueError("Unable to load image.")
+    try:
+        target = image_pool.acquire(source.shape)
+    except MemoryError:
+        source.release()
+        raise
+
+    # like apply_filter, scale back only what was decoded reduced, which needs a known (JPEG or PNG) size
+    full_size = image_size(image_bytes)
+    reduced = full_size is not None and source.shape[1::-1] != full_size
+
+    def encode(result):
+        # the worker wrote the result into target, or returned it when it did not fit
+        if result is None:
+            return None
+        processed_image = target.array() if isinstance(result, tuple) else result
+        if spec.upsample and reduced:
+            processed_image = cv2.resize(processed_image, full_size, interpolation=cv2.INTER_LINEAR)
+        with metrics.timed('encode'):
+            return Img.from_array(processed_image).encode(
+                **encoding_for(spec.target, dict(spec.encoding or {}, **OUTPUT_ENCODING)))
+
+    # the images go back to the pool once the worker is done with them, also when it crashed
+    return enqueue(message, job_name, apply_filter_shared, source, target, spec.target, cache_key=cache_key,
+                   heavy=spec.heavy, transform=encode, resources=[source, target], **kwargs)
 
 # handler for the /start command
 @bot.message_handler(commands=['start'])
 def handle_start(message):
     bot.send_message(message.chat.id,
                 "Hello!\n\nSend me an image and choose a filter:\n"
-                     "- Blur: Reduce noise and detail.\n"
-                     "- Rotate: Turn the image upside down.\n"
-                     "- Salt and Pepper: Add random bright and dark pixels.\n"
-                     "- Segment: Divide the image based on color.\n"
-                     "- Grayscale: Convert to grayscale.\n"
-                     "- Sharpen: Enhance edges and details.\n"
-                     "- Emboss: Create a raised effect.\n"
-                     "- Invert Colors: Invert the image colors.\n"
-                     "- Oil Painting: Apply an oil painting-like effect.\n"
-                     "- Cartoonize: Create a cartoon-like version.\n")
+                     f"{filters.help_text()}\n"
+                     "\nAdd parameters after the filter name, e.g. \"Blur 5\" or \"Oil Painting size=9\".\n"
+                     "Send several photos as an album to apply a filter to all of them.\n"
+                     "Send a GIF or a short video to apply a filter to every frame.\n"
+                     "Send /preview to see every filter applied to your image.\n"
+                     "Send /cancel to stop the filters still running for you.\n")
+
+
+# handler for the /preview command
+@bot.message_handler(commands=['preview'])
+def handle_preview(message):
+    try:
+        state = sessions.get(message.chat.id) or {}
+        photo = state.get('concat_pending') or (state['album']['photos'][0] if 'album' in state else None)
+        if photo is None:
+            bot.reply_to(message, "Please send an image first.")
+            return
+        # every built-in filter in one job, sharing the decode and the grayscale/median steps, at preview size
+        specs = [spec for spec in filters if isinstance(spec.target, str)]
+        image = pick_photo(photo, PREVIEW_MAX_SIDE)
+        enqueue(message, 'preview', preview_filters, download_photo(image, message.chat.id), [spec.target for spec in specs],
+                PREVIEW_MAX_SIDE, OUTPUT_ENCODING, captions=[spec.name.title() for spec in specs], heavy=True)
+    except Exception as e:
+        bot.reply_to(message, f"Error previewing filters: {e}")
+
+
+# handler for the /cancel command
+@bot.message_handler(commands=['cancel'])
+def handle_cancel(message):
+    cancelled = pool.cancel(message.chat.id)
+    bot.reply_to(message, f"Cancelled {cancelled} running filter(s)." if cancelled else "Nothing to cancel.")
 
 # handler for receiving photos
 @bot.message_handler(content_types=['photo'])
 def handle_image(message):
     try:
         print("Received a photo message")
-        # get the photo file id
-        file_id = message.photo[-1].file_id
-        # get the file object using the file id
-        file_info = bot.get_file(file_id)
-        # download the file
-        downloaded_file = bot.download_file(file_info.file_path)
-
-        # save the file temporarily with a unique name based on the file id
-        image_path = f"images/{file_id}.jpg"
-        with open(image_path, 'wb') as new_file:
-            new_file.write(downloaded_file)
-
-        # check if this is the first image or the second image for concatenation
-        if message.chat.id in user_images:
-            print("User already has an image in memory")
-            if 'concat_pending' in user_images[message.chat.id]:
-                print("This is the second image for concatenation")
-                # this is the second image for concatenation
-                second_image_path = image_path
-                first_image_path = user_images[message.chat.id]['concat_pending']
-                del user_images[message.chat.id]['concat_pending']
-
-                # load the images
-                img_processor = Img(first_image_path)
-                first_image_data = cv2.imread(first_image_path)
-                second_image_data = cv2.imread(second_image_path)
-
-                # concatenate the images
-                concatenated_image = img_processor.concat(second_image_data)
-                if concatenated_image is not None:
-                    print("Concatenation successful")
-                    # save and send the concatenated image
-                    processed_image_path = img_processor.save_image(concatenated_image, suffix='_concatenated')
-                    with open(processed_image_path, 'rb') as photo_file:
-                        bot.send_photo(message.chat.id, photo_file)
-                else:
-                    print("Error concatenating images.")
-                    bot.reply_to(message, "Error concatenating images.")
-
-                # clear user history
-                del user_images[message.chat.id]
-            else:
-                # this is the first image
-                print("This is the first image for concatenation")
-                user_images[message.chat.id]['concat_pending'] = image_path
-                bot.reply_to(message, "First image saved successfully! Now please send the second image to concatenate with.")
+        photo = photo_ref(message)
+
+        # photos of an album arrive as separate messages sharing a media_group_id
+        if message.media_group_id is not None:
+            def add_to_album(state):
+                if state and state.get('album', {}).get('media_group_id') == message.media_group_id:
+                    state['album']['photos'].append(photo)
+                    return state
+                return {'album': {'media_group_id': message.media_group_id, 'photos': [photo]}}
+
+            previous = sessions.update(message.chat.id, add_to_album)
+            if not previous or previous.get('album', {}).get('media_group_id') != message.media_group_id:
+                bot.reply_to(message, "Album saved successfully! Choose a filter to apply it to every photo.")
+            return
+
+        # a pending image makes this the second image for concatenation, otherwise it becomes the pending one;
+        # both happen in one atomic update, so two photos arriving together cannot both become the first
+        def register_photo(state):
+            if state and 'concat_pending' in state:
+                return None
+            return {'concat_pending': photo}
+
+        previous = sessions.update(message.chat.id, register_photo)
+        if previous and 'concat_pending' in previous:
+            print("This is the second image for concatenation")
+            # concatenate the images in a worker, unless the result is cached
+            first_image, second_image = pick_photo(previous['concat_pending']), pick_photo(photo)
+            cache_key = make_key(f"{first_image['file_unique_id']}+{second_image['file_unique_id']}", 'concat')
+            if not send_cached(message, cache_key):
+                # the downloads are kept in memory and never written to disk
+                enqueue(message, 'concatenation', concat_images,
+                        *download_photos([first_image, second_image], message.chat.id), encoding=OUTPUT_ENCODING,
+                        cache_key=cache_key)
         else:
             # this is the first image
             print("This is the first image received")
-            user_images[message.chat.id] = {'concat_pending': image_path}
             bot.reply_to(message, "First image saved successfully! To apply the concatenation filter, please send another image or choose a filter from the list at the top of the page to apply a filter.")
     except Exception as e:
         print(f"Error handling image: {e}")
         bot.reply_to(message, f"Error handling image: {e}")
 
+# handler for receiving GIFs and videos
+@bot.message_handler(content_types=['animation', 'video'])
+def handle_clip(message):
+    try:
+        clip = message.animation or message.video
+        if clip.file_size and clip.file_size > MAX_DOWNLOAD_BYTES:
+            bot.reply_to(message, f"This clip is too large, please send one under "
+                                  f"{MAX_DOWNLOAD_BYTES // (1024 * 1024)} MB.")
+            return
+        # a clip replaces any pending image or album
+        sessions.set(message.chat.id, {'clip': {'file_id': clip.file_id, 'file_unique_id': clip.file_unique_id}})
+        bot.reply_to(message, "Clip saved successfully! Choose a filter to apply it to every frame.")
+    except Exception as e:
+        print(f"Error handling clip: {e}")
+        bot.reply_to(message, f"Error handling clip: {e}")
+
 # handler for filter selection
-@bot.message_handler(
-    func=lambda message: message.text.lower() in ['blur', 'rotate', 'salt and pepper', 'segment', 'grayscale',
-                                                  'sharpen', 'emboss', 'invert colors', 'oil painting', 'cartoonize'])
+@bot.message_handler(func=lambda message: filters.matches(message.text))
 def handle_filter(message):
     try:
-        # Check if the user has previously sent an image
-        if message.chat.id in user_images:
-            # Get the image path
-            if 'concat_pending' in user_images[message.chat.id]:
-                image_path = user_images[message.chat.id]['concat_pending']
-            else:
-                image_path = user_images[message.chat.id]['first_image']
-
-            # apply the selected filter
-            img_processor = Img(image_path)
-            filter_name = message.text.lower()
-
-            if filter_name == 'blur':
-                processed_image = img_processor.blur()
-            elif filter_name == 'rotate':
-                processed_image = img_processor.rotate()
-            elif filter_name == 'salt and pepper':
-                processed_image = img_processor.salt_n_pepper()
-            elif filter_name == 'segment':
-                processed_image = img_processor.segment()
-            elif filter_name == 'grayscale':
-                processed_image = img_processor.grayscale()
-            elif filter_name == 'sharpen':
-                processed_image = img_processor.sharpen()
-            elif filter_name == 'emboss':
-                processed_image = img_processor.emboss()
-            elif filter_name == 'invert colors':
-                processed_image = img_processor.invert_colors()
-            elif filter_name == 'oil painting':
-                processed_image = img_processor.oil_painting()
-            elif filter_name == 'cartoonize':
-                processed_image = img_processor.cartoonize()
+        # invalid parameters are reported before the pending image is used up
+        try:
+            spec, params = filters.parse(message.text)
+        except ValueError as e:
+            bot.reply_to(message, str(e))
+            return
+
+        # Take the image the user previously sent, atomically, so it is used by a single filter
+        state = sessions.update(message.chat.id, lambda state: None)
+        if state is None:
+            bot.reply_to(message, "Please send an image first.")
+            return
+
+        job_name = f'{spec.name} filter'
+        # the decoded image belongs to the job, so filters that can work in place do
+        kwargs = dict(params, **spec.resolution, **({'in_place': True} if spec.in_place else {}),
+                      encoding=dict(spec.encoding or {}, **OUTPUT_ENCODING))
+
+        # apply the filter to every frame of a clip, streamed through one job
+        if 'clip' in state:
+            clip = state['clip']
+            max_side = min(spec.max_side or VIDEO_MAX_SIDE, VIDEO_MAX_SIDE)
+            cache_key = make_key(clip['file_unique_id'], spec.name, dict(params, max_side=max_side))
+            if send_cached(message, cache_key, send_video):
+                queued = True
             else:
-                processed_image = None
-
-            # check if the filter was applied successfully
-            if processed_image is not None:
-                # save and send the processed image
-                processed_image_path = img_processor.save_image(processed_image, suffix=f'_{filter_name.replace(" ", "_")}')
-                with open(processed_image_path, 'rb') as photo_file:
-                    bot.send_photo(message.chat.id, photo_file)
+                queued = enqueue(message, job_name, apply_filter_video, download_photo(clip, message.chat.id),
+                                 spec.target, max_side=max_side, max_frames=VIDEO_MAX_FRAMES, cache_key=cache_key,
+                                 heavy=True, send=send_video, **params, **({'in_place': True} if spec.in_place else {}))
+        # apply the filter to every photo of an album in one job
+        elif 'album' in state:
+            images = download_photos([pick_photo(photo, spec.max_side) for photo in state['album']['photos']],
+                                     message.chat.id)
+            queued = enqueue(message, job_name, apply_filter_batch, images, spec.target, heavy=spec.heavy, **kwargs)
+        else:
+            # apply the selected filter in a worker, unless the result is cached
+            image = pick_photo(state['concat_pending'], spec.max_side)
+            cache_key = make_key(image['file_unique_id'], spec.name, dict(params, **spec.resolution))
+            if send_cached(message, cache_key):
+                queued = True
             else:
-                bot.reply_to(message, f"Error applying {filter_name} filter: Result is None.")
+                image_bytes = download_photo(image, message.chat.id)
+                queued = None
+                if image_pool is not None and isinstance(spec.target, str):
+                    try:
+                        queued = enqueue_shared(message, job_name, spec, image_bytes, cache_key, **params,
+                                                **({'in_place': True} if spec.in_place else {}))
+                    except MemoryError:
+                        print("Shared image pool is full, sending the photo as bytes")
+                if queued is None:
+                    queued = enqueue(message, job_name, apply_filter, image_bytes, spec.target, cache_key=cache_key,
+                                     heavy=spec.heavy, **kwargs)
 
-            # remove the image path from the dict
-            del user_images[message.chat.id]
-        else:
-            bot.reply_to(message, "Please send an image first.")
+        # give the image back when the user has to retry
+        if not queued:
+            sessions.set(message.chat.id, state)
     except Exception as e:
         bot.reply_to(message, f"Error processing image: {e}")
 
-# Start polling
-bot.polling()
+# Start the bot, either behind a webhook or with long polling
+if BOT_MODE == 'webhook':
+    server = WebhookServer(bot, secret_token=os.getenv('WEBHOOK_SECRET'),
+                           max_in_flight=int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 64)),
+                           handler_threads=int(os.getenv('WEBHOOK_HANDLER_THREADS', 32)), metrics=metrics)
+    metrics.watch(server=server)
+    server.run(port=int(os.getenv('WEBHOOK_PORT', 5000)), webhook_url=os.getenv('WEBHOOK_URL'))
+else:
+    metrics.serve(int(os.getenv('METRICS_PORT', 8000)))
+    bot.remove_webhook()
+    bot.polling()
+
+# let the filters that were already accepted finish and send their results
+pool.shutdown(cancel=False)
+if image_pool is not None:
+    image_pool.close()
+downloads.shutdown()
+telegram.close()
@@ -0,0 +1,186 @@
+from importlib.metadata import entry_points
+
+# bot.py imports the modules of this directory directly, the tests through the polybot package
+try:
+    from img_proc import BLUR_MODES
+except ImportError:
+    from polybot.img_proc import BLUR_MODES
+
+# entry point group third-party packages register their filters under
+ENTRY_POINT_GROUP = 'polybot.filters'
+
+
+class Param:
+    def __init__(self, name, type=int, default=None, min=None, max=None, choices=None):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.min = min
+        self.max = max
+        self.choices = choices
+
+    def parse(self, value):
+        try:
+            value = self.type(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{self.name} must be a{'n' if self.type is int else ''} {self.type.__name__}.")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"{self.name} must be one of: {', '.join(map(str, self.choices))}.")
+        if self.min is not None and value < self.min or self.max is not None and value > self.max:
+            raise ValueError(f"{self.name} must be between {self.min} and {self.max}.")
+        return value
+
+    def describe(self):
+        if self.choices is not None:
+            return f"{self.name}: {'/'.join(map(str, self.choices))}"
+        return f"{self.name}: {self.min}-{self.max}"
+
+
+class FilterSpec:
+    # target is the name of an Img method, or a function called with (img, **params) that returns
+    # the filtered array; functions must be importable by name so they can be sent to the workers.
+    # Heavy filters get a bounded share of the worker pool, in_place ones may overwrite the decoded
+    # image, and max_side/upsample bound the resolution they are applied at. encoding overrides
+    # img_proc.Img.encode arguments for the results, on top of the profile of the target.
+
+    def __init__(self, name, target, description='', aliases=(), params=(), cost='cheap', in_place=False,
+                 max_side=None, upsample=False, encoding=None):
+        if cost not in ['cheap', 'heavy']:
+            raise ValueError("Invalid cost. Please use 'cheap' or 'heavy'.")
+        self.name = name.lower()
+        self.target = target
+        self.description = description
+        self.aliases = tuple(alias.lower() for alias in aliases)
+        self.params = tuple(params)
+        self.cost = cost
+        self.in_place = in_place
+        self.max_side = max_side
+        self.upsample = upsample
+        self.encoding = encoding
+
+    @property
+    def heavy(self):
+        return self.cost == 'heavy'
+
+    @property
+    def resolution(self):
+        # the apply_filter keyword arguments bounding the decoded resolution
+        return {'max_side': self.max_side, 'upsample': self.upsample} if self.max_side else {}
+
+    def parse_params(self, args):
+        # positional values in declaration order, or name=value pairs
+        if len(args) > len(self.params):
+            raise ValueError(f"{self.name.title()} takes at most {len(self.params)} parameter(s).")
+        by_name = {param.name.lower(): param for param in self.params}
+        values = {}
+        for param, arg in zip(self.params, args):
+            if '=' in arg:
+                name, arg = arg.split('=', 1)
+                if name.lower() not in by_name:
+                    raise ValueError(f"Unknown parameter {name} for {self.name.title()}.")
+                param = by_name[name.lower()]
+            values[param.name] = param.parse(arg)
+        return values
+
+
+class FilterRegistry:
+    def __init__(self):
+        self._filters = {}
+        # every name and alias, for O(1) lookups of user input
+        self._lookup = {}
+        self._max_words = 1
+
+    def __iter__(self):
+        return iter(self._filters.values())
+
+    def __len__(self):
+        return len(self._filters)
+
+    def __contains__(self, name):
+        return name.lower() in self._lookup
+
+    def register(self, spec):
+        # registering a filter under an existing name replaces it, but names and aliases of other filters are kept
+        for name in (spec.name,) + spec.aliases:
+            owner = self._lookup.get(name)
+            if owner is not None and owner.name != spec.name:
+                raise ValueError(f"Filter name {name} is already taken by {owner.name}.")
+        previous = self._filters.pop(spec.name, None)
+        if previous is not None:
+            for name in (previous.name,) + previous.aliases:
+                del self._lookup[name]
+        self._filters[spec.name] = spec
+        for name in (spec.name,) + spec.aliases:
+            self._lookup[name] = spec
+            self._max_words = max(self._max_words, len(name.split()))
+        return spec
+
+    def get(self, name):
+        return self._lookup.get(' '.join(name.lower().split()))
+
+    def parse(self, text):
+        # Splits "salt and pepper 0.1" into the filter and its validated parameters, raising
+        # ValueError for bad parameters; returns (None, None) when no filter name leads the text
+        words = text.lower().split()
+        for count in range(min(self._max_words, len(words)), 0, -1):
+            spec = self._lookup.get(' '.join(words[:count]))
+            if spec is not None:
+                return spec, spec.parse_params(words[count:])
+        return None, None
+
+    def matches(self, text):
+        # predicate for the bot's message handler
+        if not text:
+            return False
+        words = text.lower().split()
+        return any(' '.join(words[:count]) in self._lookup for count in range(1, min(self._max_words, len(words)) + 1))
+
+    def help_text(self):
+        lines = []
+        for spec in self:
+            line = f"- {spec.name.title()}: {spec.description}"
+            if spec.params:
+                line += f" ({', '.join(param.describe() for param in spec.params)})"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def load_entry_points(self, group=ENTRY_POINT_GROUP):
+        # Each entry point names a FilterSpec, or a list of them, e.g. in a plugin's pyproject.toml:
+        # [project.entry-points."polybot.filters"]
+        # sepia = "polybot_sepia:SEPIA"
+        loaded = []
+        for entry_point in entry_points(group=group):
+            try:
+                specs = entry_point.load()
+                for spec in specs if isinstance(specs, (list, tuple)) else [specs]:
+                    loaded.append(self.register(spec))
+            except Exception as e:
+                print(f"Error loading filter plugin {entry_point.name}: {e}")
+        return loaded
+
+
+def default_registry():
+    registry = FilterRegistry()
+    registry.register(FilterSpec('blur', 'blur', "Reduce noise and detail.",
+                                 params=[Param('blur_level', int, 16, 1, 201),
+                                         Param('mode', str, 'gaussian', choices=BLUR_MODES)]))
+    registry.register(FilterSpec('rotate', 'rotate', "Turn the image upside down."))
+    registry.register(FilterSpec('salt and pepper', 'salt_n_pepper', "Add random bright and dark pixels.",
+                                 aliases=['salt n pepper', 'noise'], params=[Param('amount', float, 0.05, 0, 1)],
+                                 in_place=True))
+    registry.register(FilterSpec('segment', 'segment', "Divide the image based on color.",
+                                 params=[Param('num_clusters', int, 100, 2, 256)], cost='heavy',
+                                 max_side=640, upsample=True))
+    registry.register(FilterSpec('grayscale', 'grayscale', "Convert to grayscale.", aliases=['greyscale', 'gray']))
+    registry.register(FilterSpec('sharpen', 'sharpen', "Enhance edges and details."))
+    registry.register(FilterSpec('emboss', 'emboss', "Create a raised effect."))
+    registry.register(FilterSpec('invert colors', 'invert_colors', "Invert the image colors.",
+                                 aliases=['invert', 'negative'], in_place=True))
+    registry.register(FilterSpec('oil painting', 'oil_painting', "Apply an oil painting-like effect.",
+                                 params=[Param('size', int, 7, 3, 31), Param('dynRatio', float, 0.2, 0.01, 1)],
+                                 cost='heavy', max_side=1280))
+    registry.register(FilterSpec('cartoonize', 'cartoonize', "Create a cartoon-like version.",
+                                 aliases=['cartoon'],
+                                 params=[Param('quality', str, 'balanced', choices=['exact', 'high', 'balanced', 'fast'])],
+                                 cost='heavy', max_side=1280))
+    return registry
@@ -1,16 +1,153 @@
 import os
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+EMBOSS_KERNEL = np.array([[0, -1, -1], [1, 0, -1], [1, 1, 0]])
+INVERT_LUT = np.arange(255, -1, -1, dtype=np.uint8)
+
+# decode flags for cv2.IMREAD_REDUCED_*, by downscale factor
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+DEFAULT_TILE_MEMORY = 16 * 1024 * 1024
+
+JPEG_SUBSAMPLING = {
+    '444': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+    '422': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+    '420': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+}
+# Telegram rejects photos larger than this
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+# 'auto' picks PNG for images where at least this share of pixels repeats its left neighbor
+# (graphics, flat renders), JPEG otherwise; PNG and WebP cost 20-30x a JPEG encode on photos
+FLAT_RATIO = 0.9
+
+# How filter results are encoded: the format, JPEG/WebP quality, JPEG chroma subsampling, a byte
+# budget met by lowering the quality down to min_quality, and whether grayscale content is encoded
+# as one channel ('auto' checks the channels). Profiles override the default per filter: sharp
+# outputs keep full chroma resolution, smooth ones tolerate a lower quality.
+DEFAULT_ENCODING = {'format': 'auto', 'quality': 90, 'subsampling': '420', 'target_bytes': MAX_PHOTO_BYTES,
+                    'min_quality': 40, 'gray': 'auto'}
+ENCODE_PROFILES = {
+    'blur': {'quality': 85},
+    'sharpen': {'subsampling': '444'},
+    'emboss': {'subsampling': '444'},
+    'cartoonize': {'subsampling': '444'},
+    'grayscale': {'gray': True},
+}
+
+BLUR_MODES = ['gaussian', 'box', 'median', 'stack']
+# Gaussian kernels up to this size run as they are, larger ones as a chain of box blurs, whose
+# running sums cost the same per pixel at any radius
+GAUSSIAN_MAX_KERNEL = 31
+
+# Cartoonize presets. The bilateral filter runs on a 1/scale downsample of the image (a power of
+# two), in passes of the given diameter, and is scaled back up; levels quantizes every channel
+# through a LUT (None keeps all 256). The edge mask is thresholded from a median blur of the given
+# size. 'exact' is the original full-resolution filter.
+CARTOONIZE_PRESETS = {
+    'exact': {'scale': 1, 'diameter': 9, 'passes': 1, 'levels': None, 'median': 7},
+    'high': {'scale': 2, 'diameter': 5, 'passes': 1, 'levels': None, 'median': 7},
+    'balanced': {'scale': 2, 'diameter': 5, 'passes': 1, 'levels': 24, 'median': 7},
+    'fast': {'scale': 4, 'diameter': 5, 'passes': 2, 'levels': 12, 'median': 5},
+}
+
+# Neighborhood filters that can run on horizontal strips: the halo (in rows) each strip needs
+# on both sides for its center to match the full-frame result, and the temporaries the filter
+# allocates besides its output, relative to the input size.
+TILED_FILTERS = {
+    'blur': (lambda blur_level=16, mode='gaussian': blur_halo(blur_level, mode), 0),
+    'sharpen': (lambda: SHARPEN_KERNEL.shape[0] // 2, 0),
+    'emboss': (lambda: EMBOSS_KERNEL.shape[0] // 2, 0),
+    # median blur (3) feeding the adaptive threshold (4), or the bilateral passes on the downsample
+    'cartoonize': (lambda quality='balanced': cartoonize_halo(CARTOONIZE_PRESETS[quality]), 2),
+    'oil_painting': (lambda size=7, dynRatio=0.2, method='auto': (size | 1) // 2, 6),
+}
+
+
+# Filters that treat every pixel on its own, so a stack of frames goes through one call viewed as
+# a single (frames * height, width, 3) image; small frames (GIFs) are dominated by per-call overhead
+STACKED_FILTERS = {
+    'invert_colors': lambda frames: cv2.bitwise_not(frames, dst=frames),
+    'grayscale': lambda frames: cv2.cvtColor(cv2.cvtColor(frames, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR),
+}
+# filtered clips are written as MP4, with the first codec the OpenCV build can encode; Telegram
+# plays H.264 inline, builds without an H.264 encoder fall back to MPEG-4 Part 2
+VIDEO_FOURCCS = ['avc1', 'mp4v']
+DEFAULT_FPS = 25
+_video_fourcc = None
+
+
+# Observations of the job running in this process, as (metric, value, labels) tuples. They are only
+# collected inside collect_timings, which hands them back to the bot process with the job's result.
+_observations = None
+
+
+def observe(metric, value, **labels):
+    if _observations is not None:
+        _observations.append((metric, value, labels))
+
+
+@contextmanager
+def timed(stage, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+
+def collect_timings(submitted_at, func, *args, **kwargs):
+    # runs a worker entry point and returns (result, observations); the first one is the queue wait
+    global _observations
+    _observations = [('stage_seconds', max(0.0, time.time() - submitted_at), {'stage': 'queue'})]
+    try:
+        return func(*args, **kwargs), _observations
+    finally:
+        _observations = None
+
+
 class Img:
-    def __init__(self, image_path):
+    def __init__(self, image_path=None, image_bytes=None, image_data=None, reduce=1):
         self.image_path = image_path
-        self.image_data = self.load_image()
+        self.reduce = reduce
+        self.image_data = image_data if image_data is not None else self.load_image(image_bytes)
+        self._shared = None
+
+    @classmethod
+    def from_bytes(cls, image_bytes, max_side=None):
+        # with max_side, decode at the smallest 1/2, 1/4 or 1/8 scale that still covers it
+        reduce = 1
+        if max_side:
+            size = image_size(image_bytes)
+            if size is not None:
+                reduce = reduction_for(size, max_side)
+        return cls(image_bytes=image_bytes, reduce=reduce)
+
+    @classmethod
+    def from_array(cls, image_data):
+        return cls(image_data=image_data)
 
-    def load_image(self):
+    def load_image(self, image_bytes=None):
         try:
-            image = cv2.imread(self.image_path)
+            flags = REDUCED_DECODE_FLAGS[self.reduce]
+            with timed('decode'):
+                if image_bytes is not None:
+                    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+                else:
+                    image = cv2.imread(self.image_path, flags)
             if image is not None:
+                observe('image_megapixels', image.shape[0] * image.shape[1] / 1e6)
                 return image
             else:
                 raise FileNotFoundError(" Unable to load image.")
@@ -24,21 +161,100 @@ class Img:
             if not os.path.exists(directory):
                 os.makedirs(directory)
 
-            file_path = os.path.join(directory, f"{os.path.basename(self.image_path).split('.')[0]}{suffix}.jpg")
-            cv2.imwrite(file_path, image_data)
+            name = os.path.basename(self.image_path).split('.')[0] if self.image_path else 'image'
+            file_path = os.path.join(directory, f"{name}{suffix}.jpg")
+            with timed('encode'):
+                cv2.imwrite(file_path, image_data)
             print(f"Image saved successfully: {file_path}")
             return file_path
         except Exception as e:
             print(f"Error saving image: {e}")
             return None
 
-    def blur(self, blur_level=16):
+    def encode(self, image_data=None, format='jpg', quality=95, subsampling=None, target_bytes=None,
+               min_quality=40, gray=False):
+        try:
+            image_data = self.image_data if image_data is None else image_data
+            if image_data is None:
+                raise ValueError("No image data available.")
+            if image_data.dtype != np.uint8:
+                image_data = np.uint8(np.clip(image_data, 0, 255))
+            if subsampling is not None and subsampling not in JPEG_SUBSAMPLING:
+                raise ValueError(f"Invalid subsampling. Please use one of: {', '.join(JPEG_SUBSAMPLING)}.")
+
+            with timed('encode'):
+                format = format.lower().lstrip('.')
+                if format == 'auto':
+                    format = 'png' if is_flat(image_data) else 'jpg'
+                if image_data.ndim == 3 and format != 'webp' and (gray is True or gray == 'auto' and is_gray(image_data)):
+                    image_data = image_data[..., 0]
+
+                buffer = self._encode(image_data, format, quality, subsampling)
+                if target_bytes is None or len(buffer) <= target_bytes:
+                    return buffer.tobytes()
+                if format not in ['jpg', 'jpeg', 'webp']:
+                    # lossless output over the budget falls back to JPEG
+                    format = 'jpg'
+                    buffer = self._encode(image_data, format, quality, subsampling)
+                    if len(buffer) <= target_bytes:
+                        return buffer.tobytes()
+
+                # bisect for the highest quality within the budget, the smallest output when none is
+                low, high = min_quality, quality - 1
+                best = None
+                while low <= high:
+                    middle = (low + high) // 2
+                    candidate = self._encode(image_data, format, middle, subsampling)
+                    if len(candidate) <= target_bytes:
+                        best, low = candidate, middle + 1
+                    else:
+                        buffer, high = candidate, middle - 1
+                return (best if best is not None else buffer).tobytes()
+        except Exception as e:
+            print(f"Error encoding image: {e}")
+            return None
+
+    @staticmethod
+    def _encode(image_data, format, quality, subsampling):
+        if format in ['jpg', 'jpeg']:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+            if subsampling is not None:
+                params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, JPEG_SUBSAMPLING[subsampling]]
+        elif format == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            params = []
+        success, buffer = cv2.imencode('.' + format, image_data, params)
+        if not success:
+            raise ValueError(f"Unable to encode image as {format}.")
+        return buffer
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def blur(self, blur_level=16, mode='gaussian'):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
+            if mode not in BLUR_MODES:
+                raise ValueError(f"Invalid mode. Please use one of: {', '.join(BLUR_MODES)}.")
             blur_level = max(1, blur_level)
             blur_level = blur_level + 1 if blur_level % 2 == 0 else blur_level
-            blurred_image = cv2.GaussianBlur(self.image_data, (blur_level, blur_level), 0)
+            if mode == 'box':
+                return cv2.blur(self.image_data, (blur_level, blur_level))
+            if mode == 'median':
+                return cv2.medianBlur(self.image_data, blur_level) if blur_level > 1 else self.image_data.copy()
+            if mode == 'stack':
+                if not hasattr(cv2, 'stackBlur'):
+                    raise ValueError("Stack blur needs OpenCV 4.7 or later.")
+                return cv2.stackBlur(self.image_data, (blur_level, blur_level))
+            if blur_level <= GAUSSIAN_MAX_KERNEL:
+                blurred_image = cv2.GaussianBlur(self.image_data, (blur_level, blur_level), 0)
+                return blurred_image
+            # three box blurs approximate the Gaussian within about 50 dB PSNR
+            blurred_image = self.image_data
+            for width in gaussian_boxes(blur_level):
+                blurred_image = cv2.blur(blurred_image, (width, width))
             return blurred_image
         except Exception as e:
             print(f"Error applying blur: {e}")
@@ -46,81 +262,148 @@ class Img:
 
     def rotate(self):
         try:
-            img = cv2.imread(self.image_path)
-            if img is None:
-                raise FileNotFoundError("Unable to load image.")
-            rotated_img = cv2.rotate(img, cv2.ROTATE_180)
+            if self.image_data is None:
+                raise ValueError("No image data available.")
+            rotated_img = cv2.rotate(self.image_data, cv2.ROTATE_180)
             return rotated_img
         except Exception as e:
             print(f"Error rotating image: {e}")
             return None
 
-    def salt_n_pepper(self, amount=0.05):
+    def salt_n_pepper(self, amount=0.05, seed=None, in_place=False):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            noisy_image = self.image_data.copy()
-            mask = np.random.choice([0, 1, 2], size=noisy_image.shape[:2], p=[amount / 2, amount / 2, 1 - amount])
-            noisy_image[mask == 0] = 0
-            noisy_image[mask == 1] = 255
+            if not 0 <= amount <= 1:
+                raise ValueError("Amount must be between 0 and 1.")
+            noisy_image = self.image_data if in_place else self.image_data.copy()
+
+            # One random integer per pixel, uint8 when the threshold is exact at that precision.
+            # Values below the threshold become pepper, the next band of the same width becomes salt.
+            dtype = np.uint8 if (amount / 2 * 256).is_integer() else np.uint16
+            levels = np.iinfo(dtype).max + 1
+            threshold = round(amount / 2 * levels)
+            if threshold == 0:
+                return noisy_image
+
+            rng = np.random.default_rng(seed)
+            noise = rng.integers(0, levels, size=noisy_image.shape[:2], dtype=dtype)
+            mask = np.less(noise, threshold)
+            noisy_image[mask] = 0
+            # shift the salt band down onto [0, threshold) in place, reusing the same mask buffer
+            np.subtract(noise, threshold, out=noise)
+            np.less(noise, threshold, out=mask)
+            noisy_image[mask] = 255
             return noisy_image
         except Exception as e:
             print(f"Error adding salt and pepper noise: {e}")
             return None
 
-    def concat(self, other_image_data, direction='horizontal'):
+    def concat(self, other_image_data, direction='horizontal', fit='resize', columns=None, background=0, out=None):
+        # other_image_data is one image or a list of them. Images of different sizes are resized
+        # (keeping their aspect ratio) or padded to a common edge, and each one is written
+        # straight into its place in a single output array, which can be passed in as out.
         try:
             if self.image_data is None or other_image_data is None:
                 raise ValueError("Image data is missing.")
+            others = list(other_image_data) if isinstance(other_image_data, (list, tuple)) else [other_image_data]
+            images = [self.image_data] + others
+            if any(image is None for image in images):
+                raise ValueError("Image data is missing.")
 
-            if direction not in ['horizontal', 'vertical']:
-                raise ValueError("Invalid direction. Please use 'horizontal' or 'vertical'.")
-
-            if direction == 'horizontal':
-                concatenated_img = np.concatenate((self.image_data, other_image_data), axis=1)
-            else:
-                concatenated_img = np.concatenate((self.image_data, other_image_data), axis=0)
+            shape, placements = concat_layout([image.shape[:2] for image in images], direction, fit, columns)
+            shape = shape + (3,)
+            if out is None:
+                covered = sum(height * width for _, _, height, width in placements)
+                out = np.empty(shape, np.uint8) if covered == shape[0] * shape[1] else np.full(shape, background, np.uint8)
+            elif out.shape != shape or out.dtype != np.uint8:
+                raise ValueError(f"out must be a uint8 array of shape {shape}.")
 
-            return concatenated_img
+            for image, (top, left, height, width) in zip(images, placements):
+                place_image(image, out[top:top + height, left:left + width])
+            return out
         except Exception as e:
             print(f"Error concatenating images: {e}")
             return None
 
-    def segment(self, num_clusters=100):
+    def segment(self, num_clusters=100, method='fast', sample_size=10000, attempts=None,
+                max_iter=100, sampling='random', lut_bits=5, seed=None):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
+            if method not in ['fast', 'exact']:
+                raise ValueError("Invalid method. Please use 'fast' or 'exact'.")
+
+            if method == 'exact':
+                return self._segment_exact(num_clusters, attempts or 10, max_iter)
+            return self._segment_fast(num_clusters, sample_size, attempts or 3, max_iter, sampling, lut_bits, seed)
+        except Exception as e:
+            print(f"Error segmenting image: {e}")
+            return None
 
-            image_rgb = cv2.cvtColor(self.image_data, cv2.COLOR_BGR2RGB)
-            pixels = image_rgb.reshape((-1, 3))
-            pixels = np.float32(pixels)
+    def _segment_exact(self, num_clusters, attempts, max_iter):
+        image_rgb = cv2.cvtColor(self.image_data, cv2.COLOR_BGR2RGB)
+        pixels = image_rgb.reshape((-1, 3))
+        pixels = np.float32(pixels)
 
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-            _, labels, centers = cv2.kmeans(pixels, num_clusters, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, max_iter, 0.2)
+        _, labels, centers = cv2.kmeans(pixels, num_clusters, None, criteria, attempts, cv2.KMEANS_RANDOM_CENTERS)
 
-            centers = np.uint8(centers)
-            segmented_image = centers[labels.flatten()]
-            segmented_image = segmented_image.reshape(image_rgb.shape)
+        centers = np.uint8(centers)
+        segmented_image = centers[labels.flatten()]
+        segmented_image = segmented_image.reshape(image_rgb.shape)
 
-            # Convert segmented image back to BGR format
-            segmented_image_bgr = cv2.cvtColor(segmented_image, cv2.COLOR_RGB2BGR)
+        # Convert segmented image back to BGR format
+        segmented_image_bgr = cv2.cvtColor(segmented_image, cv2.COLOR_RGB2BGR)
 
-            # Darken the segmented image
-            segmented_image_bgr = segmented_image_bgr * 0.5  # Reduce brightness by 50%
+        # Darken the segmented image
+        segmented_image_bgr = segmented_image_bgr * 0.5  # Reduce brightness by 50%
 
-            return segmented_image_bgr
-        except Exception as e:
-            print(f"Error segmenting image: {e}")
-            return None
+        return segmented_image_bgr
+
+    def _segment_fast(self, num_clusters, sample_size, attempts, max_iter, sampling, lut_bits, seed):
+        if sampling not in ['random', 'strided']:
+            raise ValueError("Invalid sampling. Please use 'random' or 'strided'.")
+        if not 1 <= lut_bits <= 8:
+            raise ValueError("lut_bits must be between 1 and 8.")
 
+        # k-means is channel-order agnostic, so work on BGR directly and skip the color conversions
+        pixels = self.image_data.reshape((-1, 3))
+        num_pixels = len(pixels)
+        sample_size = min(max(sample_size, num_clusters), num_pixels)
 
+        # Fit the centers on a sample of the pixels only
+        if sampling == 'random':
+            rng = np.random.default_rng(seed)
+            sample = pixels[rng.choice(num_pixels, size=sample_size, replace=False)]
+        else:
+            sample = pixels[::max(1, num_pixels // sample_size)][:sample_size]
+        sample = np.float32(sample)
+
+        num_clusters = min(num_clusters, len(sample))
+        if seed is not None:
+            cv2.setRNGSeed(seed)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, max_iter, 0.2)
+        _, _, centers = cv2.kmeans(sample, num_clusters, None, criteria, attempts, cv2.KMEANS_PP_CENTERS)
+
+        # Quantize the color cube and map every cell to its nearest center, darkened by 50% like the exact path
+        shift = 8 - lut_bits
+        levels = np.arange(1 << lut_bits, dtype=np.float32) * (1 << shift) + ((1 << shift) - 1) / 2
+        cells = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape((-1, 3))
+        distances = (cells * cells).sum(axis=1)[:, None] - 2 * cells @ centers.T + (centers * centers).sum(axis=1)
+        palette = np.uint8(np.clip(centers, 0, 255) * 0.5)
+        lut = palette[distances.argmin(axis=1)]
+
+        # Label every pixel with a single table lookup
+        quantized = (self.image_data >> shift).astype(np.int32)
+        index = (quantized[..., 0] << (2 * lut_bits)) | (quantized[..., 1] << lut_bits) | quantized[..., 2]
+        return lut[index]
 
     def grayscale(self):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            gray_image = cv2.cvtColor(self.image_data, cv2.COLOR_BGR2GRAY)
-            return cv2.cvtColor(gray_image, cv2.COLOR_GRAY2BGR)
+            return cv2.cvtColor(self._gray_image(), cv2.COLOR_GRAY2BGR)
         except Exception as e:
             print(f"Error converting image to grayscale: {e}")
             return None
@@ -129,8 +412,7 @@ class Img:
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-            sharpened_image = cv2.filter2D(self.image_data, -1, kernel)
+            sharpened_image = cv2.filter2D(self.image_data, -1, SHARPEN_KERNEL)
             return sharpened_image
         except Exception as e:
             print(f"Error applying sharpen filter: {e}")
@@ -140,54 +422,667 @@ class Img:
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            kernel = np.array([[0, -1, -1], [1, 0, -1], [1, 1, 0]])
-            embossed_image = cv2.filter2D(self.image_data, -1, kernel)
+            embossed_image = cv2.filter2D(self.image_data, -1, EMBOSS_KERNEL)
             return embossed_image
         except Exception as e:
             print(f"Error applying emboss filter: {e}")
             return None
 
-    def invert_colors(self):
+    def invert_colors(self, in_place=False):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            inverted_image = cv2.bitwise_not(self.image_data)
+            inverted_image = cv2.bitwise_not(self.image_data, dst=self.image_data if in_place else None)
             return inverted_image
         except Exception as e:
             print(f"Error inverting colors: {e}")
             return None
 
-    def oil_painting(self, size=7, dynRatio=0.2):
+    def oil_painting(self, size=7, dynRatio=0.2, method='auto'):
+        # Every pixel takes the mean color of the pixels in its size x size window that fall in the
+        # window's most frequent intensity bin; dynRatio is the width of a bin relative to the 0-255
+        # range. method is 'xphoto' (OpenCV contrib), 'histogram', or 'auto' for the former when installed.
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
+            size = size + 1 if size % 2 == 0 else size
+            bin_width = min(256, max(1, int(round(dynRatio * 255))))
+            if method == 'auto':
+                method = 'xphoto' if hasattr(cv2, 'xphoto') else 'histogram'
+            if method == 'xphoto':
+                # its window spans 2 * size + 1 pixels, and it divides intensities by the bin width
+                return cv2.xphoto.oilPainting(self.image_data, size // 2, bin_width, cv2.COLOR_BGR2GRAY)
+            if method != 'histogram':
+                raise ValueError(f"Unknown oil painting method: {method}.")
+            return self._oil_painting_histogram(size, bin_width)
+        except Exception as e:
+            print(f"Error applying oil painting effect: {e}")
+            return None
 
-            # Convert image to grayscale
-            gray_image = cv2.cvtColor(self.image_data, cv2.COLOR_BGR2GRAY)
-
-            # Apply median blur to create a smoother image
-            blurred_image = cv2.medianBlur(gray_image, size)
+    def _oil_painting_histogram(self, size, bin_width):
+        # The window histograms are kept one bin at a time: a box filter over a bin's indicator plane
+        # counts that bin in every window, and over the masked image sums the colors of its pixels. Box
+        # filters slide with running sums, so the cost grows with the number of bins, not with size^2.
+        image_data = self.image_data
+        bins = cv2.LUT(self._gray_image(), np.uint8(np.arange(256) // bin_width))
+        count_depth, count_type = (cv2.CV_8U, np.uint8) if size * size <= 255 else (cv2.CV_16U, np.uint16)
+        sum_depth, sum_type = (cv2.CV_16U, np.uint16) if 255 * size * size <= 65535 else (cv2.CV_32S, np.int32)
 
-            # Apply adaptive threshold to create a binary image
-            _, mask = cv2.threshold(blurred_image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        best_count = np.zeros(bins.shape, count_type)
+        best_sum = np.zeros(image_data.shape, sum_type)
+        mask, ones, better = (np.empty(bins.shape, np.uint8) for _ in range(3))
+        count = np.empty(bins.shape, count_type)
+        masked = np.empty_like(image_data)
+        sums = np.empty(image_data.shape, sum_type)
+        for value in range(255 // bin_width + 1):
+            cv2.compare(bins, value, cv2.CMP_EQ, dst=mask)
+            cv2.bitwise_and(mask, 1, dst=ones)
+            cv2.boxFilter(ones, count_depth, (size, size), dst=count, normalize=False)
+            # ties keep the lower bin
+            cv2.compare(count, best_count, cv2.CMP_GT, dst=better)
+            if not cv2.countNonZero(better):
+                continue
+            masked.fill(0)
+            cv2.copyTo(image_data, mask, masked)
+            cv2.boxFilter(masked, sum_depth, (size, size), dst=sums, normalize=False)
+            cv2.copyTo(count, better, best_count)
+            cv2.copyTo(sums, better, best_sum)
 
-            # Create an output image using bitwise and operation with original image
-            oil_painting_effect = cv2.bitwise_and(self.image_data, self.image_data, mask=mask)
+        # every pixel is in its own window, so the winning count is never zero
+        return cv2.divide(best_sum, cv2.merge([best_count.astype(sum_type)] * 3), dtype=cv2.CV_8U)
 
-            return oil_painting_effect
-        except Exception as e:
-            print(f"Error applying oil painting effect: {e}")
-            return None
-    def cartoonize(self):
+    def cartoonize(self, quality='balanced'):
         try:
             if self.image_data is None:
                 raise ValueError("No image data available.")
-            gray_image = cv2.cvtColor(self.image_data, cv2.COLOR_BGR2GRAY)
-            blurred_image = cv2.medianBlur(gray_image, 7)
-            edges = cv2.adaptiveThreshold(blurred_image, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 9)
-            color = cv2.bilateralFilter(self.image_data, 9, 300, 300)
+            if quality not in CARTOONIZE_PRESETS:
+                raise ValueError(f"Unknown cartoonize quality: {quality}.")
+            preset = CARTOONIZE_PRESETS[quality]
+            edges = self._edges(preset['median'])
+            color = self._smooth_colors(preset['scale'], preset['diameter'], preset['passes'])
+            if preset['levels'] is not None:
+                color = cv2.LUT(color, quantize_lut(preset['levels']), dst=color)
             cartoon_image = cv2.bitwise_and(color, color, mask=edges)
             return cartoon_image
         except Exception as e:
             print(f"Error cartoonizing image: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def apply_many(self, filters):
+        # filters is a list of method names, or a dict of method name to keyword arguments.
+        # The grayscale and median blur steps are computed once and shared by every filter.
+        if not isinstance(filters, dict):
+            filters = {name: {} for name in filters}
+        self._shared = {}
+        try:
+            return {name: getattr(self, name)(**kwargs) for name, kwargs in filters.items()}
+        finally:
+            self._shared = None
+
+    def _gray_image(self):
+        return self._shared_step('gray', lambda: cv2.cvtColor(self.image_data, cv2.COLOR_BGR2GRAY))
+
+    def _median_gray(self, size):
+        return self._shared_step(('median', size), lambda: cv2.medianBlur(self._gray_image(), size))
+
+    def _edges(self, size=7):
+        return self._shared_step(('edges', size), lambda: cv2.adaptiveThreshold(
+            self._median_gray(size), 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 9))
+
+    def _smooth_colors(self, scale, diameter, passes):
+        # Edge-preserving smoothing. A bilateral pass costs pixels x diameter^2, so it runs on a
+        # downsample where a small diameter covers the same area as a large one at full size.
+        image_data = self.image_data
+        if scale > 1:
+            # pad to whole blocks, so every output pixel only depends on its own neighborhood
+            height, width = image_data.shape[:2]
+            pad_bottom, pad_right = -height % scale, -width % scale
+            if pad_bottom or pad_right:
+                image_data = cv2.copyMakeBorder(image_data, 0, pad_bottom, 0, pad_right, cv2.BORDER_REFLECT_101)
+            # halving repeatedly is much faster than one large INTER_AREA step, with the same block averages
+            for _ in range(scale.bit_length() - 1):
+                image_data = cv2.resize(image_data, (image_data.shape[1] // 2, image_data.shape[0] // 2),
+                                        interpolation=cv2.INTER_AREA)
+        for _ in range(passes):
+            image_data = cv2.bilateralFilter(image_data, diameter, 300, 300)
+        if scale > 1:
+            image_data = cv2.resize(image_data, (image_data.shape[1] * scale, image_data.shape[0] * scale),
+                                    interpolation=cv2.INTER_LINEAR)[:height, :width]
+        return image_data
+
+    def _shared_step(self, key, compute):
+        # intermediates are only kept while apply_many runs, so later changes to image_data never see stale ones
+        if self._shared is None:
+            return compute()
+        if key not in self._shared:
+            self._shared[key] = compute()
+        return self._shared[key]
+
+
+    def tiled(self, filter_name, max_memory=DEFAULT_TILE_MEMORY, out=None, **kwargs):
+        try:
+            if self.image_data is None:
+                raise ValueError("No image data available.")
+            for top, tile in self.iter_tiles(filter_name, max_memory, **kwargs):
+                if out is None:
+                    out = np.empty((self.image_data.shape[0],) + tile.shape[1:], tile.dtype)
+                out[top:top + len(tile)] = tile
+            return out
+        except Exception as e:
+            print(f"Error applying tiled {filter_name}: {e}")
+            return None
+
+    def iter_tiles(self, filter_name, max_memory=DEFAULT_TILE_MEMORY, **kwargs):
+        # Yields (first row, rows) strips of the filtered image from top to bottom, so the
+        # result can be written out or encoded row by row without holding all of it.
+        if filter_name not in TILED_FILTERS:
+            raise ValueError(f"{filter_name} does not support tiled processing.")
+        halo_for, temporaries = TILED_FILTERS[filter_name]
+        halo = halo_for(**kwargs)
+
+        height = self.image_data.shape[0]
+        row_bytes = self.image_data[0].nbytes * (1 + temporaries)
+        rows = max(1, max_memory // row_bytes - 2 * halo)
+
+        if filter_name == 'cartoonize':
+            # strips start on the downsampling grid, so they see the same pixel blocks as the full frame
+            scale = CARTOONIZE_PRESETS[kwargs.get('quality', 'balanced')]['scale']
+            rows = max(scale, rows // scale * scale)
+
+        for top in range(0, height, rows):
+            bottom = min(height, top + rows)
+            start, end = max(0, top - halo), min(height, bottom + halo)
+            tile = getattr(Img.from_array(self.image_data[start:end]), filter_name)(**kwargs)
+            if tile is None:
+                raise ValueError(f"{filter_name} failed on rows {top}-{bottom}.")
+            yield top, tile[top - start:bottom - start]
+
+
+def concat_layout(sizes, direction='horizontal', fit='resize', columns=None):
+    # Places images of the given (height, width) sizes, returning the output's (height, width) and a
+    # (top, left, height, width) box per image. Resizing shrinks to the smallest common edge, padding
+    # grows to the largest and centers each image; a grid uses equal cells, columns x rows.
+    if direction not in ['horizontal', 'vertical', 'grid']:
+        raise ValueError("Invalid direction. Please use 'horizontal', 'vertical' or 'grid'.")
+    if fit not in ['resize', 'pad']:
+        raise ValueError("Invalid fit. Please use 'resize' or 'pad'.")
+    common = min if fit == 'resize' else max
+
+    placements = []
+    if direction == 'grid':
+        columns = columns or int(np.ceil(np.sqrt(len(sizes))))
+        cell_height, cell_width = common(h for h, _ in sizes), common(w for _, w in sizes)
+        for index, (height, width) in enumerate(sizes):
+            if fit == 'resize':
+                scale = min(cell_height / height, cell_width / width)
+                height, width = max(1, round(height * scale)), max(1, round(width * scale))
+            top = index // columns * cell_height + (cell_height - height) // 2
+            left = index % columns * cell_width + (cell_width - width) // 2
+            placements.append((top, left, height, width))
+        rows = -(-len(sizes) // columns)
+        return (rows * cell_height, min(columns, len(sizes)) * cell_width), placements
+
+    # the cross edge is the height of a horizontal strip, the width of a vertical one
+    axis = 0 if direction == 'horizontal' else 1
+    cross = common(size[axis] for size in sizes)
+    offset = 0
+    for size in sizes:
+        along = size[1 - axis]
+        if fit == 'resize':
+            along = max(1, round(along * cross / size[axis]))
+            size = (cross, along) if axis == 0 else (along, cross)
+        margin = (cross - size[axis]) // 2
+        placements.append((margin, offset) + size if axis == 0 else (offset, margin) + size)
+        offset += along
+    return ((cross, offset) if axis == 0 else (offset, cross)), placements
+
+
+def place_image(image, view):
+    # writes image into a view of the output, resizing it on the way when the sizes differ
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    height, width = view.shape[:2]
+    if image.shape[:2] == (height, width):
+        view[...] = image
+    else:
+        shrinking = height * width < image.shape[0] * image.shape[1]
+        cv2.resize(image, (width, height), dst=view, interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+
+def gaussian_boxes(kernel_size, passes=3):
+    # Widths of the box blurs whose chain has the variance of OpenCV's Gaussian for kernel_size
+    # (Kovesi, "Fast almost-Gaussian filtering"): odd widths wl and wl + 2, m of the former
+    sigma = 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+    ideal = np.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal)
+    lower = lower - 1 if lower % 2 == 0 else lower
+    count = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if index < count else lower + 2 for index in range(passes)]
+
+
+def blur_halo(blur_level=16, mode='gaussian'):
+    if mode == 'stack':
+        # OpenCV's stack blur does not give the same rows on strips as on the whole image
+        raise ValueError("Stack blur does not support tiled processing.")
+    blur_level = max(1, blur_level)
+    blur_level = blur_level + 1 if blur_level % 2 == 0 else blur_level
+    if mode == 'gaussian' and blur_level > GAUSSIAN_MAX_KERNEL:
+        return sum(width // 2 for width in gaussian_boxes(blur_level))
+    return blur_level // 2
+
+
+def quantize_lut(levels):
+    # maps every value to the middle of its bucket, out of levels equal buckets
+    step = 256 / levels
+    return np.uint8(np.minimum(255, (np.arange(256) // step) * step + step / 2))
+
+
+def cartoonize_halo(preset):
+    # rows a strip needs around it: the edge mask's median blur and adaptive threshold, or the
+    # bilateral passes on the downsample plus a block for the interpolation and one for the padding
+    scale = preset['scale']
+    halo = max(preset['median'] // 2 + 4, scale * (preset['passes'] * (preset['diameter'] // 2) + 2))
+    return -(-halo // scale) * scale
+
+
+def encoding_for(method_name=None, encoding=None):
+    # Img.encode arguments for a filter's result: the default, its profile, then the caller's overrides
+    return {**DEFAULT_ENCODING, **ENCODE_PROFILES.get(method_name, {}), **(encoding or {})}
+
+
+def is_flat(image, rows=64):
+    # share of pixels equal to their left neighbor, on evenly spaced rows
+    rows = image[::max(1, image.shape[0] // rows)]
+    same = rows[:, 1:] == rows[:, :-1]
+    if same.ndim == 3:
+        same = same.all(axis=2)
+    return same.mean() >= FLAT_RATIO
+
+
+def is_gray(image, rows=64):
+    # evenly spaced rows first, so color images are rejected without a full pass
+    if image.ndim == 2 or image.shape[2] == 1:
+        return True
+    for rows in (image[::max(1, image.shape[0] // rows)], image):
+        if not (np.array_equal(rows[..., 0], rows[..., 1]) and np.array_equal(rows[..., 1], rows[..., 2])):
+            return False
+    return True
+
+
+def image_size(image_bytes):
+    # (width, height) from the JPEG or PNG header, without decoding any pixels
+    data = bytes(image_bytes[:64 * 1024])
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if data[:2] == b'\xff\xd8':
+        position = 2
+        while position + 9 <= len(data):
+            if data[position] != 0xFF:
+                return None
+            marker = data[position + 1]
+            if marker == 0xFF:
+                position += 1
+                continue
+            length = int.from_bytes(data[position + 2:position + 4], 'big')
+            # start-of-frame markers, excluding DHT, JPG and DAC
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height = int.from_bytes(data[position + 5:position + 7], 'big')
+                width = int.from_bytes(data[position + 7:position + 9], 'big')
+                return width, height
+            position += 2 + length
+    return None
+
+
+def reduction_for(size, max_side):
+    for factor in (8, 4, 2):
+        if max(size) / factor >= max_side:
+            return factor
+    return 1
+
+
+def batch_filter(images, method_name, workers=None, **kwargs):
+    return list(iter_batch_filter(images, method_name, workers, **kwargs))
+
+
+def iter_batch_filter(images, method_name, workers=None, **kwargs):
+    # Applies one filter to a list or stream of images (Img, arrays or encoded bytes) on a thread
+    # pool; OpenCV releases the GIL, so the images are filtered on all cores. Results come back in
+    # input order and at most two images per worker are in flight at once.
+    workers = workers or os.cpu_count() or 1
+
+    def run(image):
+        if not isinstance(image, Img):
+            image = Img.from_array(image) if isinstance(image, np.ndarray) else Img.from_bytes(image)
+        return getattr(image, method_name)(**kwargs) if isinstance(method_name, str) else method_name(image, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for image in images:
+            pending.append(executor.submit(run, image))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_frame_batches(capture, max_side=None, max_frames=None, batch_memory=DEFAULT_TILE_MEMORY):
+    # Decodes the frames of a cv2.VideoCapture, scaled down to max_side, straight into stacks of up
+    # to batch_memory bytes shaped (count, height, width, 3), and releases the capture at the end
+    try:
+        success, frame = capture.read()
+        if not success or max_frames == 0:
+            return
+        size = None
+        if max_side and max(frame.shape[:2]) > max_side:
+            scale = max_side / max(frame.shape[:2])
+            size = (max(1, round(frame.shape[1] * scale)), max(1, round(frame.shape[0] * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        shape = frame.shape
+        batch = np.empty((max(1, batch_memory // frame.nbytes),) + shape, np.uint8)
+        batch[0] = frame
+        count = total = 1
+        scratch = None
+        while max_frames is None or total < max_frames:
+            if count == len(batch):
+                yield batch
+                batch, count = np.empty_like(batch), 0
+            # full-size frames are decoded in place, scaled ones through a reused scratch frame
+            success, frame = capture.read(image=batch[count] if size is None else scratch)
+            if not success:
+                break
+            if size is not None:
+                scratch = frame
+                cv2.resize(frame, size, dst=batch[count], interpolation=cv2.INTER_AREA)
+            elif frame.shape != shape:
+                cv2.resize(frame, (shape[1], shape[0]), dst=batch[count], interpolation=cv2.INTER_AREA)
+            elif not np.may_share_memory(frame, batch):
+                batch[count] = frame
+            count += 1
+            total += 1
+        if count:
+            yield batch[:count]
+    finally:
+        capture.release()
+
+
+def iter_frames(capture, max_side=None, max_frames=None):
+    for batch in iter_frame_batches(capture, max_side, max_frames, batch_memory=0):
+        yield batch[0]
+
+
+def filter_frames(batches, method_name, workers=None, **kwargs):
+    # Applies a filter to stacks of frames and yields the filtered frames in order. Stacked filters
+    # take a whole stack in one call, the others run frame by frame on iter_batch_filter's window.
+    if method_name in STACKED_FILTERS and set(kwargs) <= {'in_place'}:
+        for batch in batches:
+            count, height, width = batch.shape[:3]
+            yield from STACKED_FILTERS[method_name](batch.reshape(count * height, width, -1)).reshape(
+                count, height, width, -1)
+    else:
+        yield from iter_batch_filter((frame for batch in batches for frame in batch), method_name, workers, **kwargs)
+
+
+def write_frames(frames, path, fps=DEFAULT_FPS):
+    # Encodes frames into an MP4 file as they come; the size is taken from the first frame and
+    # rounded down to even, which 4:2:0 codecs require. Returns the number of frames written.
+    writer = None
+    count = 0
+    try:
+        for frame in frames:
+            if frame is None:
+                raise ValueError("Filter returned no frame.")
+            if writer is None:
+                height, width = max(2, frame.shape[0] & ~1), max(2, frame.shape[1] & ~1)
+                writer = _open_writer(path, fps, (width, height))
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            if frame.dtype != np.uint8:
+                frame = np.uint8(np.clip(frame, 0, 255))
+            writer.write(cv2.resize(frame, (width, height)) if frame.shape[:2] != (height, width) else frame)
+            count += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return count
+
+
+def _open_writer(path, fps, size):
+    global _video_fourcc
+    for fourcc in [_video_fourcc] if _video_fourcc else VIDEO_FOURCCS:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if writer.isOpened():
+            _video_fourcc = fourcc
+            return writer
+    raise ValueError("No video encoder available.")
+
+
+# Entry points for filter workers, they exchange encoded image bytes with the bot process
+def apply_filter(image_bytes, method_name, *args, max_side=None, upsample=False, encoding=None, **kwargs):
+    # method_name is an Img method, or a function called with the Img (filters from plugins).
+    # max_side bounds the decoded resolution; with upsample the result is scaled back to the full size.
+    # encoding overrides the filter's encode profile
+    img = Img.from_bytes(image_bytes, max_side)
+    with timed('filter', filter=method_name if isinstance(method_name, str) else method_name.__name__):
+        if img.image_data is not None and method_name in TILED_FILTERS and not args \
+                and img.image_data.nbytes * TILED_FILTERS[method_name][1] > DEFAULT_TILE_MEMORY:
+            # filters with full-frame temporaries go through strips on large photos to bound their working memory
+            processed_image = img.tiled(method_name, **kwargs)
+        elif isinstance(method_name, str):
+            processed_image = getattr(img, method_name)(*args, **kwargs)
+        else:
+            processed_image = method_name(img, *args, **kwargs)
+        if processed_image is None:
+            return None
+        if upsample and img.reduce > 1:
+            processed_image = cv2.resize(processed_image, image_size(image_bytes), interpolation=cv2.INTER_LINEAR)
+    profile = method_name if isinstance(method_name, str) else None
+    return img.encode(processed_image, **encoding_for(profile, encoding))
+
+
+def apply_filter_batch(images_bytes, method_name, workers=None, **kwargs):
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return list(executor.map(lambda image_bytes: apply_filter(image_bytes, method_name, **kwargs), images_bytes))
+
+
+def preview_filters(image_bytes, method_names, max_side=None, encoding=None):
+    img = Img.from_bytes(image_bytes, max_side)
+    with timed('filter', filter='preview'):
+        results = img.apply_many(method_names)
+    return [None if results[name] is None else img.encode(results[name], **encoding_for(name, encoding))
+            for name in method_names]
+
+
+def concat_images(*images_bytes, direction='horizontal', fit='resize', columns=None, encoding=None):
+    # The common edges are known from the headers, so every image is decoded once, at the smallest
+    # 1/2, 1/4 or 1/8 scale that still covers its place in the output
+    sizes = [image_size(image_bytes) for image_bytes in images_bytes]
+    reduce = [1] * len(images_bytes)
+    if fit == 'resize' and all(size is not None for size in sizes):
+        # the smallest common edges stay the same, so reduced images still get the planned places
+        min_width = min(width for width, _ in sizes) if direction != 'horizontal' else 0
+        min_height = min(height for _, height in sizes) if direction != 'vertical' else 0
+        for index, (width, height) in enumerate(sizes):
+            reduce[index] = next((factor for factor in (8, 4, 2) if height // factor >= min_height
+                                  and width // factor >= min_width), 1)
+    images = [Img(image_bytes=image_bytes, reduce=factor) for image_bytes, factor in zip(images_bytes, reduce)]
+    with timed('filter', filter='concat'):
+        concatenated_image = images[0].concat([img.image_data for img in images[1:]], direction, fit, columns)
+    if concatenated_image is None:
+        return None
+    return images[0].encode(concatenated_image, **encoding_for('concat', encoding))
+
+
+def decode_into(image_bytes, allocate, max_side=None):
+    # Decodes an image into allocate(shape), e.g. SharedImagePool.acquire, and returns what it
+    # returned. OpenCV's Python imdecode cannot write into a given buffer, so the pixels are copied once.
+    img = Img.from_bytes(image_bytes, max_side)
+    if img.image_data is None:
+        return None
+    image = allocate(img.image_data.shape)
+    np.copyto(image.array(), img.image_data)
+    return image
+
+
+def apply_filter_shared(source, target, method_name, *args, **kwargs):
+    # Worker entry point exchanging decoded images instead of encoded bytes: source and target are
+    # shared_images.SharedImage handles, viewed in place. The result is written into target and its
+    # shape returned, or the result itself is returned when it does not fit target. The source is
+    # never written, so a job run again after its worker was recycled reads the original pixels:
+    # in_place filters work on a copy of the source in target.
+    img = Img.from_array(source.array())
+    output = target.array()
+    if kwargs.get('in_place') and output.shape == img.image_data.shape and output.dtype == img.image_data.dtype:
+        np.copyto(output, img.image_data)
+        img = Img.from_array(output)
+    else:
+        kwargs.pop('in_place', None)
+    name = method_name if isinstance(method_name, str) else method_name.__name__
+    with timed('filter', filter=name):
+        if method_name in TILED_FILTERS and not args and output.shape == img.image_data.shape \
+                and img.image_data.nbytes * TILED_FILTERS[method_name][1] > DEFAULT_TILE_MEMORY:
+            # the strips are written straight into the target
+            processed_image = img.tiled(method_name, out=output, **kwargs)
+        elif isinstance(method_name, str):
+            processed_image = getattr(img, method_name)(*args, **kwargs)
+        else:
+            processed_image = method_name(img, *args, **kwargs)
+    if processed_image is None:
+        return None
+    if processed_image.shape != output.shape or processed_image.dtype != output.dtype:
+        return processed_image
+    if processed_image is not output:
+        np.copyto(output, processed_image)
+    return output.shape
+
+
+def apply_filter_video(video_bytes, method_name, max_side=None, max_frames=None, workers=None, **kwargs):
+    # Filters every frame of a GIF or short video and returns it as MP4. VideoCapture and VideoWriter
+    # need files, so the clip goes through a temporary directory; frames stream from the decoder
+    # through the filter to the encoder, so memory stays bounded whatever the length of the clip.
+    with tempfile.TemporaryDirectory() as directory:
+        source, target = os.path.join(directory, 'source'), os.path.join(directory, 'filtered.mp4')
+        with open(source, 'wb') as f:
+            f.write(video_bytes)
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            print("Error filtering video: Unable to open video.")
+            return None
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        fps = fps if 0 < fps <= 240 else DEFAULT_FPS
+        name = method_name if isinstance(method_name, str) else method_name.__name__
+        try:
+            with timed('filter', filter=f'{name} (video)'):
+                batches = iter_frame_batches(capture, max_side, max_frames)
+                count = write_frames(filter_frames(batches, method_name, workers, **kwargs), target, fps)
+        except Exception as e:
+            print(f"Error filtering video: {e}")
+            return None
+        finally:
+            capture.release()
+        if count == 0:
+            return None
+        with open(target, 'rb') as f:
+            return f.read()
+
+
+class Pipeline:
+    # Records filters lazily and runs them in one pass over two preallocated ping-pong buffers.
+    # Adjacent convolutions are merged into one kernel and adjacent point ops into one LUT, so a
+    # fused step saturates to uint8 once instead of after every filter.
+
+    def __init__(self, img):
+        self.img = img
+        self.steps = []
+
+    def blur(self, blur_level=16):
+        blur_level = max(1, blur_level)
+        blur_level = blur_level + 1 if blur_level % 2 == 0 else blur_level
+        self.steps.append(('blur', blur_level))
+        return self
+
+    def rotate(self):
+        self.steps.append(('rotate', None))
+        return self
+
+    def grayscale(self):
+        self.steps.append(('grayscale', None))
+        return self
+
+    def sharpen(self):
+        return self.convolve(SHARPEN_KERNEL)
+
+    def emboss(self):
+        return self.convolve(EMBOSS_KERNEL)
+
+    def convolve(self, kernel):
+        kernel = np.float32(kernel)
+        if kernel.ndim != 2 or kernel.shape[0] % 2 == 0 or kernel.shape[1] % 2 == 0:
+            raise ValueError("Kernel must be a 2D array with odd dimensions.")
+        self.steps.append(('kernel', kernel))
+        return self
+
+    def invert_colors(self):
+        return self.lut(INVERT_LUT)
+
+    def lut(self, table):
+        table = np.asarray(table)
+        if table.shape != (256,):
+            raise ValueError("LUT must have exactly 256 entries.")
+        self.steps.append(('lut', np.uint8(np.clip(table, 0, 255))))
+        return self
+
+    def compile(self):
+        compiled = []
+        for op, arg in self.steps:
+            if compiled and compiled[-1][0] == op == 'kernel':
+                compiled[-1] = (op, self._merge_kernels(compiled[-1][1], arg))
+            elif compiled and compiled[-1][0] == op == 'lut':
+                compiled[-1] = (op, arg[compiled[-1][1]])
+            else:
+                compiled.append((op, arg))
+        return compiled
+
+    def run(self):
+        try:
+            if self.img.image_data is None:
+                raise ValueError("No image data available.")
+
+            source = self.img.image_data
+            buffers = [np.empty_like(source), np.empty_like(source)]
+            gray = scratch = None
+            for i, (op, arg) in enumerate(self.compile()):
+                target = buffers[i % 2]
+                if op == 'blur' and arg > GAUSSIAN_MAX_KERNEL:
+                    # the box chain of Img.blur, alternating with a scratch buffer so the last pass lands in target
+                    widths = gaussian_boxes(arg)
+                    scratch = np.empty_like(source) if scratch is None else scratch
+                    outputs = [target, scratch] if len(widths) % 2 else [scratch, target]
+                    blurred = source
+                    for j, width in enumerate(widths):
+                        blurred = cv2.blur(blurred, (width, width), dst=outputs[j % 2])
+                elif op == 'blur':
+                    cv2.GaussianBlur(source, (arg, arg), 0, dst=target)
+                elif op == 'rotate':
+                    cv2.rotate(source, cv2.ROTATE_180, dst=target)
+                elif op == 'grayscale':
+                    gray = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY, dst=gray)
+                    cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=target)
+                elif op == 'kernel':
+                    cv2.filter2D(source, -1, arg, dst=target)
+                elif op == 'lut':
+                    cv2.LUT(source, arg, dst=target)
+                source = target
+
+            return source.copy() if source is self.img.image_data else source
+        except Exception as e:
+            print(f"Error running filter pipeline: {e}")
+            return None
+
+    @staticmethod
+    def _merge_kernels(first, second):
+        # filter2D correlates, and correlating with `first` then `second` equals
+        # correlating once with their full convolution
+        merged = np.zeros((first.shape[0] + second.shape[0] - 1, first.shape[1] + second.shape[1] - 1), np.float32)
+        for (y, x), weight in np.ndenumerate(second):
+            merged[y:y + first.shape[0], x:x + first.shape[1]] += weight * first
+        return merged
@@ -0,0 +1,97 @@
+import time
+from contextlib import contextmanager
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest, \
+    start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MEGAPIXEL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 12, 16, 24, 48)
+
+
+class Metrics:
+    # Stage timings are recorded in this process with timed(); the worker processes collect theirs
+    # with img_proc.collect_timings and the bot records them here with record()
+
+    def __init__(self, registry=None, log_level='DEBUG'):
+        self.registry = CollectorRegistry() if registry is None else registry
+        self.log_level = log_level
+        self.stage_seconds = Histogram('polybot_stage_seconds', 'Time spent in each processing stage.',
+                                       ['stage', 'filter'], buckets=STAGE_BUCKETS, registry=self.registry)
+        self.stage_in_flight = Gauge('polybot_stage_in_flight', 'Operations currently running in each stage.',
+                                     ['stage'], registry=self.registry)
+        self.image_megapixels = Histogram('polybot_image_megapixels', 'Size of the images decoded for processing.',
+                                          buckets=MEGAPIXEL_BUCKETS, registry=self.registry)
+
+    @contextmanager
+    def timed(self, stage, filter=''):
+        in_flight = self.stage_in_flight.labels(stage)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            in_flight.dec()
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, filter=filter)
+
+    def observe(self, metric, value, **labels):
+        if metric == 'stage_seconds':
+            stage, filter_name = labels.get('stage', ''), labels.get('filter', '')
+            self.stage_seconds.labels(stage, filter_name).observe(value)
+            logger.bind(stage=stage, filter=filter_name, seconds=round(value, 6)).log(
+                self.log_level, "{} {}took {:.1f} ms", stage, f"({filter_name}) " if filter_name else '', value * 1000)
+        elif metric == 'image_megapixels':
+            self.image_megapixels.observe(value)
+
+    def record(self, observations):
+        for metric, value, labels in observations:
+            self.observe(metric, value, **labels)
+
+    def watch(self, pool=None, cache=None, server=None):
+        # pool, cache and webhook server statistics are read when /metrics is scraped
+        self.registry.register(_StatsCollector(pool, cache, server))
+
+    def render(self):
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+    def serve(self, port, addr='0.0.0.0'):
+        start_http_server(port, addr, registry=self.registry)
+
+
+class _StatsCollector:
+    def __init__(self, pool=None, cache=None, server=None):
+        self.pool = pool
+        self.cache = cache
+        self.server = server
+
+    def describe(self):
+        # an empty description keeps the registry from collecting at registration time
+        return []
+
+    def collect(self):
+        if self.pool is not None:
+            yield GaugeMetricFamily('polybot_pool_in_flight', 'Filter jobs queued or running in the worker pool.',
+                                    value=self.pool.in_flight)
+            yield GaugeMetricFamily('polybot_pool_queue_depth', 'Filter jobs waiting for a free worker.',
+                                    value=self.pool.queue_depth)
+            yield CounterMetricFamily('polybot_pool_timeouts', 'Filter jobs that overran their timeout.',
+                                      value=self.pool.timed_out)
+            yield CounterMetricFamily('polybot_pool_recycles', 'Times the worker processes were replaced to stop '
+                                      'a timed out job.', value=self.pool.recycled)
+        if self.cache is not None:
+            stats = self.cache.stats
+            requests = CounterMetricFamily('polybot_cache_requests', 'Result cache lookups.', labels=['result'])
+            requests.add_metric(['hit'], stats['hits'])
+            requests.add_metric(['miss'], stats['misses'])
+            yield requests
+            yield CounterMetricFamily('polybot_cache_evictions', 'Result cache entries evicted.',
+                                      value=stats['evictions'])
+            yield GaugeMetricFamily('polybot_cache_hit_ratio', 'Share of result cache lookups that hit.',
+                                    value=self.cache.hit_ratio)
+            size = GaugeMetricFamily('polybot_cache_bytes', 'Bytes held by each result cache tier.', labels=['tier'])
+            size.add_metric(['memory'], self.cache.memory_bytes)
+            size.add_metric(['disk'], self.cache.disk_bytes)
+            yield size
+        if self.server is not None:
+            yield GaugeMetricFamily('polybot_webhook_in_flight', 'Webhook updates being handled.',
+                                    value=self.server.in_flight)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(image, filter_name, params=None):
+    # image is either a stable id (Telegram's file_unique_id) or the raw image bytes
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = 'sha256:' + hashlib.sha256(image).hexdigest()
+    payload = json.dumps([image, filter_name, params or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, directory=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        if directory is not None:
+            self._load_disk_index()
+
+    @property
+    def hit_ratio(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+    @property
+    def memory_bytes(self):
+        return self._memory_bytes
+
+    @property
+    def disk_bytes(self):
+        return self._disk_bytes
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.stats['hits'] += 1
+                    self.stats['memory_hits'] += 1
+                    return value
+                self._memory_remove(key)
+
+            value = self._disk_get(key, now)
+            if value is not None:
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+                # promote to the memory tier, keeping the original expiry
+                self._memory_put(key, value, self._disk[key][1])
+                return value
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        value = bytes(value)
+        with self._lock:
+            self._memory_put(key, value, expires)
+            if self.directory is not None:
+                self._disk_put(key, value, expires)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._disk):
+                self._disk_remove(key)
+
+    def _memory_put(self, key, value, expires):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_remove(key)
+        self._memory[key] = (value, expires)
+        self._memory_bytes += len(value)
+        while self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._memory_remove(oldest)
+            self.stats['evictions'] += 1
+
+    def _memory_remove(self, key):
+        value, _ = self._memory.pop(key)
+        self._memory_bytes -= len(value)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load_disk_index(self):
+        # rebuild the LRU order from the files' write times after a restart
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for written, name, size in sorted(entries):
+            self._disk[name] = (size, written + self.ttl)
+            self._disk_bytes += size
+
+    def _disk_get(self, key, now):
+        entry = self._disk.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            self._disk_remove(key)
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                value = f.read()
+        except OSError:
+            self._disk_remove(key)
+            return None
+        self._disk.move_to_end(key)
+        return value
+
+    def _disk_put(self, key, value, expires):
+        if len(value) > self.disk_max_bytes:
+            return
+        if key in self._disk:
+            self._disk_remove(key)
+        try:
+            # write then rename, so a crash never leaves a truncated entry behind
+            temp_path = self._disk_path(key) + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(value)
+            os.replace(temp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+            return
+        self._disk[key] = (len(value), expires)
+        self._disk_bytes += len(value)
+        while self._disk_bytes > self.disk_max_bytes:
+            self._disk_remove(next(iter(self._disk)))
+            self.stats['evictions'] += 1
+
+    def _disk_remove(self, key):
+        size, _ = self._disk.pop(key)
+        self._disk_bytes -= size
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
@@ -0,0 +1,150 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    # Per-chat state shared by the handlers. States are JSON-serializable dicts, so any
+    # implementation can keep them outside the bot process and share them between replicas.
+
+    def get(self, chat_id):
+        raise NotImplementedError
+
+    def set(self, chat_id, state):
+        raise NotImplementedError
+
+    def delete(self, chat_id):
+        raise NotImplementedError
+
+    def update(self, chat_id, func):
+        # Atomically replaces the state with func(state), or deletes it when func returns None,
+        # and returns the state from before the update
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, ttl=900, max_entries=10000, on_expire=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # called with (chat_id, state) for every state dropped by expiry or eviction
+        self.on_expire = on_expire
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, chat_id):
+        with self._lock:
+            state = self._get(chat_id, time.time())
+        return copy.deepcopy(state)
+
+    def set(self, chat_id, state):
+        with self._lock:
+            self._set(chat_id, copy.deepcopy(state))
+        self.purge()
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._states.pop(chat_id, None)
+
+    def update(self, chat_id, func):
+        with self._lock:
+            previous = self._get(chat_id, time.time())
+            state = func(copy.deepcopy(previous))
+            if state is None:
+                self._states.pop(chat_id, None)
+            else:
+                self._set(chat_id, state)
+        self.purge()
+        return copy.deepcopy(previous)
+
+    def purge(self):
+        # Drops expired states and the least recently updated ones beyond max_entries. States are
+        # kept in update order, which is also expiry order, so only the expired head is visited.
+        now = time.time()
+        dropped = []
+        with self._lock:
+            while self._states and next(iter(self._states.values()))[1] <= now:
+                chat_id, (state, _) = self._states.popitem(last=False)
+                dropped.append((chat_id, state))
+            while len(self._states) > self.max_entries:
+                chat_id, (state, _) = self._states.popitem(last=False)
+                dropped.append((chat_id, state))
+        for chat_id, state in dropped:
+            self._expired(chat_id, state)
+        return len(dropped)
+
+    def _get(self, chat_id, now):
+        entry = self._states.get(chat_id)
+        if entry is None:
+            return None
+        state, expires = entry
+        return state if expires > now else None
+
+    def _set(self, chat_id, state):
+        self._states[chat_id] = (state, time.time() + self.ttl)
+        self._states.move_to_end(chat_id)
+
+    def _expired(self, chat_id, state):
+        if self.on_expire is not None:
+            try:
+                self.on_expire(chat_id, state)
+            except Exception as e:
+                print(f"Error cleaning up session of chat {chat_id}: {e}")
+
+
+class RedisSessionStore(SessionStore):
+    # Works with any redis-py compatible client (redis.Redis, fakeredis.FakeRedis). Expiry is left
+    # to Redis key TTLs, and memory bounds to the server's maxmemory policy.
+
+    def __init__(self, client, ttl=900, prefix='polybot:session:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, chat_id):
+        return self._loads(self.client.get(self._key(chat_id)))
+
+    def set(self, chat_id, state):
+        self.client.set(self._key(chat_id), json.dumps(state), ex=self._ttl())
+
+    def delete(self, chat_id):
+        self.client.delete(self._key(chat_id))
+
+    def update(self, chat_id, func):
+        from redis.exceptions import WatchError
+        key = self._key(chat_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # optimistic transaction, retried when another replica changed the key meanwhile
+                    pipe.watch(key)
+                    previous = self._loads(pipe.get(key))
+                    state = func(copy.deepcopy(previous))
+                    pipe.multi()
+                    if state is None:
+                        pipe.delete(key)
+                    else:
+                        pipe.set(key, json.dumps(state), ex=self._ttl())
+                    pipe.execute()
+                    return previous
+                except WatchError:
+                    continue
+
+    def _key(self, chat_id):
+        return f'{self.prefix}{chat_id}'
+
+    def _ttl(self):
+        return max(1, int(round(self.ttl)))
+
+    @staticmethod
+    def _loads(raw):
+        return None if raw is None else json.loads(raw)
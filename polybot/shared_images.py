@@ -0,0 +1,186 @@
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# segments are allocated in power-of-two sizes from this one up, so a freed segment is reused by
+# later images of a similar size
+MIN_SEGMENT_BYTES = 1024 * 1024
+# segments a worker process keeps mapped between jobs
+MAX_ATTACHED = 16
+
+# name -> SharedMemory mapped by this process for handles it received, least recently used first
+_attached = OrderedDict()
+_attached_lock = threading.Lock()
+
+
+def segment_size(nbytes):
+    size = MIN_SEGMENT_BYTES
+    while size < nbytes:
+        size *= 2
+    return size
+
+
+def attach(name):
+    # maps a segment created by another process, once per process
+    with _attached_lock:
+        segment = _attached.get(name)
+        if segment is not None:
+            _attached.move_to_end(name)
+            return segment
+        segment = _attached[name] = _open_untracked(name)
+        while len(_attached) > MAX_ATTACHED:
+            _, evicted = _attached.popitem(last=False)
+            try:
+                evicted.close()
+            except BufferError:
+                # still viewed by an array of a running job, unmapped once that is collected
+                pass
+        return segment
+
+
+def _open_untracked(name):
+    # Only the owning process tracks its segments. Before Python 3.13 attaching registers the segment
+    # with this process's resource tracker, and a worker started before the owner's tracker has a
+    # tracker of its own, which unlinks the segment when the worker exits.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedImage:
+    # A reference to an array in a segment of a SharedImagePool. It pickles to its name, shape and
+    # dtype, so it can be passed to worker processes, which view the array without copying it.
+
+    def __init__(self, name, shape, dtype=np.uint8, pool=None, segment=None):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._pool = pool
+        self._segment = segment
+        self._refs = 1
+
+    def __getstate__(self):
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype.str}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['shape'], state['dtype'])
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def array(self):
+        segment = self._segment if self._segment is not None else attach(self.name)
+        return np.ndarray(self.shape, self.dtype, buffer=segment.buf)
+
+    def retain(self):
+        self._pool.retain(self)
+        self._refs += 1
+        return self
+
+    def release(self):
+        # only the process that owns the pool counts references, workers just drop their handles;
+        # a handle gives back at most the references it took, even when released too often
+        if self._pool is not None and self._refs > 0:
+            self._refs -= 1
+            self._pool.release(self)
+
+
+class SharedImagePool:
+    # Shared memory segments for images exchanged with worker processes. Segments are reference
+    # counted by the owning process and go back to a free list at zero; only this process creates
+    # and unlinks them, so a crashed worker leaves nothing behind once its jobs released their images.
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, prefix='polybot'):
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._refs = {}
+        # segment size -> names of unused segments
+        self._free = {}
+        self._bytes = 0
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def in_use(self):
+        return len(self._refs)
+
+    def acquire(self, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        size = segment_size(int(np.prod(shape)) * dtype.itemsize)
+        with self._lock:
+            names = self._free.get(size)
+            if names:
+                name = names.pop()
+            else:
+                self._reclaim(size)
+                if self._bytes + size > self.max_bytes:
+                    raise MemoryError(f"Shared image pool is full ({self._bytes} of {self.max_bytes} bytes in use).")
+                name = f'{self.prefix}_{secrets.token_hex(8)}'
+                self._segments[name] = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self._bytes += size
+            self._refs[name] = 1
+            return SharedImage(name, shape, dtype, self, self._segments[name])
+
+    def from_array(self, array):
+        image = self.acquire(array.shape, array.dtype)
+        np.copyto(image.array(), array)
+        return image
+
+    def retain(self, image):
+        with self._lock:
+            if image.name not in self._refs:
+                raise ValueError(f"Shared image {image.name} was already released.")
+            self._refs[image.name] += 1
+
+    def release(self, image):
+        with self._lock:
+            refs = self._refs.get(image.name)
+            if refs is None:
+                return
+            if refs > 1:
+                self._refs[image.name] = refs - 1
+                return
+            del self._refs[image.name]
+            self._free.setdefault(self._segments[image.name].size, []).append(image.name)
+
+    def close(self):
+        # unlinks every segment; images still in use must not be read afterwards
+        with self._lock:
+            for segment in self._segments.values():
+                self._unlink(segment)
+            self._segments.clear()
+            self._refs.clear()
+            self._free.clear()
+            self._bytes = 0
+
+    def _reclaim(self, size):
+        # unlinks free segments of other sizes until a new one of this size fits
+        for free_size, names in self._free.items():
+            while names and self._bytes + size > self.max_bytes:
+                self._unlink(self._segments.pop(names.pop()))
+                self._bytes -= free_size
+
+    @staticmethod
+    def _unlink(segment):
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            segment.close()
+        except BufferError:
+            # an array still views it, the mapping goes away with that array
+            pass
@@ -0,0 +1,187 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# the Bot API serves files of at most 20 MB
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+
+def photo_type(photo):
+    # file extension and MIME type of an encoded photo, from its signature
+    photo = bytes(photo[:12])
+    if photo.startswith(b'\x89PNG'):
+        return 'png', 'image/png'
+    if photo.startswith(b'RIFF') and photo[8:12] == b'WEBP':
+        return 'webp', 'image/webp'
+    return 'jpg', 'image/jpeg'
+
+
+class TelegramAPIError(Exception):
+    def __init__(self, method, status, description, retry_after=None):
+        super().__init__(f"{method} failed ({status}): {description}")
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+
+class TelegramIO:
+    # The Bot API calls on the image path (getFile, file downloads, sendPhoto, sendMediaGroup) over one
+    # keep-alive connection pool shared by every handler thread. Requests are retried with jittered
+    # exponential backoff on 429, 5xx and connection errors, waiting at least the retry_after Telegram
+    # asks for; sends are not retried after read timeouts, which may follow a delivered message.
+    # At most max_connections requests run at once, and at most per_chat for one chat.
+
+    def __init__(self, token, api_url='https://api.telegram.org', max_connections=16, per_chat=2, max_retries=4,
+                 backoff=0.5, max_backoff=30, timeout=(5, 60), max_download=MAX_DOWNLOAD_BYTES):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.per_chat = per_chat
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_download = max_download
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._global = threading.BoundedSemaphore(max_connections)
+        self._chats_lock = threading.Lock()
+        # chat id -> [semaphore, number of threads using it], dropped once unused
+        self._chats = {}
+
+    def close(self):
+        self.session.close()
+
+    def get_file(self, file_id, chat_id=None):
+        return self.call('getFile', chat_id, file_id=file_id)
+
+    def download(self, file_path, chat_id=None, size=None):
+        # streams the file into one buffer, preallocated when its size is known
+        url = f'{self.api_url}/file/bot{self.token}/{file_path}'
+        return self._request('download', 'GET', url, chat_id, stream=True,
+                             read=lambda response: self._read_body(response, size))
+
+    def download_file(self, file_id, chat_id=None):
+        file_info = self.get_file(file_id, chat_id)
+        return self.download(file_info['file_path'], chat_id, file_info.get('file_size'))
+
+    def send_photo(self, chat_id, photo, caption=None, reply_to_message_id=None):
+        extension, mime_type = photo_type(photo)
+        return self.call('sendPhoto', chat_id, files={'photo': (f'image.{extension}', bytes(photo), mime_type)},
+                         caption=caption, reply_to_message_id=reply_to_message_id)
+
+    def send_video(self, chat_id, video, caption=None, reply_to_message_id=None):
+        return self.call('sendVideo', chat_id, files={'video': ('video.mp4', bytes(video), 'video/mp4')},
+                         caption=caption, reply_to_message_id=reply_to_message_id, supports_streaming='true')
+
+    def send_media_group(self, chat_id, photos, captions=None):
+        captions = captions or [None] * len(photos)
+        media, files = [], {}
+        for index, (photo, caption) in enumerate(zip(photos, captions)):
+            item = {'type': 'photo', 'media': f'attach://photo{index}'}
+            if caption is not None:
+                item['caption'] = caption
+            media.append(item)
+            extension, mime_type = photo_type(photo)
+            files[f'photo{index}'] = (f'image{index}.{extension}', bytes(photo), mime_type)
+        return self.call('sendMediaGroup', chat_id, files=files, media=json.dumps(media))
+
+    def call(self, method, chat_id=None, files=None, **params):
+        data = {key: value for key, value in params.items() if value is not None}
+        if chat_id is not None and method.startswith('send'):
+            data['chat_id'] = chat_id
+        response = self._request(method, 'POST', f'{self.api_url}/bot{self.token}/{method}', chat_id,
+                                 data=data, files=files)
+        payload = self._json(response)
+        if not payload.get('ok'):
+            raise TelegramAPIError(method, response.status_code, payload.get('description', response.reason))
+        return payload['result']
+
+    def _request(self, method, http_method, url, chat_id=None, read=None, **kwargs):
+        # the body is read while the request still holds its slots, so streamed downloads are bounded too
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slot(chat_id):
+                    response = self.session.request(http_method, url, timeout=self.timeout, **kwargs)
+                    if response.status_code != 429 and response.status_code < 500:
+                        if response.status_code >= 400 and read is not None:
+                            response.close()
+                            raise TelegramAPIError(method, response.status_code, response.reason)
+                        return read(response) if read is not None else response
+                    error = self._error(method, response)
+                    response.close()
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    urllib3.exceptions.HTTPError) as e:
+                if method.startswith('send') and not isinstance(e, requests.ConnectionError):
+                    # a read timeout or broken response may follow a delivered message, which a retry would send twice
+                    raise
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(self._delay(attempt, getattr(error, 'retry_after', None)))
+
+    def _delay(self, attempt, retry_after=None):
+        # full jitter spreads retries of many threads, and retry_after is a lower bound
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return delay if retry_after is None else retry_after + delay
+
+    @contextmanager
+    def _slot(self, chat_id):
+        if chat_id is None:
+            with self._global:
+                yield
+            return
+        with self._chats_lock:
+            entry = self._chats.setdefault(chat_id, [threading.Semaphore(self.per_chat), 0])
+            entry[1] += 1
+        try:
+            with entry[0], self._global:
+                yield
+        finally:
+            with self._chats_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[chat_id]
+
+    def _read_body(self, response, size=None):
+        length = response.headers.get('Content-Length')
+        size = int(length) if length is not None else size
+        if size is not None and size > self.max_download:
+            raise TelegramAPIError('download', response.status_code, f"File is larger than {self.max_download} bytes.")
+        if length is not None and 'Content-Encoding' not in response.headers:
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            received = 0
+            while received < size:
+                count = response.raw.readinto(view[received:])
+                if not count:
+                    raise requests.ConnectionError(f"Download ended after {received} of {size} bytes.")
+                received += count
+            return buffer
+        buffer = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            buffer += chunk
+            if len(buffer) > self.max_download:
+                raise TelegramAPIError('download', response.status_code,
+                                       f"File is larger than {self.max_download} bytes.")
+        return buffer
+
+    @staticmethod
+    def _json(response):
+        try:
+            return response.json()
+        except ValueError:
+            return {'ok': False, 'description': response.reason}
+
+    def _error(self, method, response):
+        payload = self._json(response)
+        retry_after = payload.get('parameters', {}).get('retry_after') or response.headers.get('Retry-After')
+        return TelegramAPIError(method, response.status_code, payload.get('description', response.reason),
+                                float(retry_after) if retry_after is not None else None)
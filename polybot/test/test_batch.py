@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+import cv2
+import numpy as np
+from polybot.img_proc import Img, apply_filter_batch, batch_filter, iter_batch_filter, preview_filters
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+        with open(img_path, 'rb') as f:
+            cls.image_bytes = f.read()
+
+    def test_apply_many_matches_single_filters(self):
+        names = ['grayscale', 'oil_painting', 'cartoonize', 'invert_colors']
+        results = self.img.apply_many(names)
+        self.assertEqual(list(results), names)
+        for name in names:
+            np.testing.assert_array_equal(results[name], getattr(self.img, name)())
+
+    def test_apply_many_with_arguments(self):
+        results = self.img.apply_many({'blur': {'blur_level': 5}, 'oil_painting': {'size': 5}})
+        np.testing.assert_array_equal(results['blur'], self.img.blur(5))
+        np.testing.assert_array_equal(results['oil_painting'], self.img.oil_painting(size=5))
+
+    def test_apply_many_shares_intermediates(self):
+        with patch('polybot.img_proc.cv2.medianBlur', wraps=cv2.medianBlur) as median_blur, \
+                patch('polybot.img_proc.cv2.cvtColor', wraps=cv2.cvtColor) as cvt_color:
+            self.img.apply_many(['oil_painting', 'cartoonize', 'grayscale'])
+        self.assertEqual(median_blur.call_count, 1)
+        # one BGR to gray conversion, plus grayscale's conversion back to BGR
+        self.assertEqual(cvt_color.call_count, 2)
+        self.assertIsNone(self.img._shared)
+
+    def test_batch_filter_keeps_order(self):
+        images = [self.img.image_data, self.img.image_data[:300], self.image_bytes,
+                  Img.from_array(self.img.image_data[:, :200])]
+        results = batch_filter(images, 'invert_colors', workers=2)
+        self.assertEqual([result.shape[:2] for result in results], [(660, 660), (300, 660), (660, 660), (660, 200)])
+        np.testing.assert_array_equal(results[0], self.img.invert_colors())
+
+    def test_iter_batch_filter_streams(self):
+        images = (self.img.image_data[:100 + i] for i in range(10))
+        heights = [result.shape[0] for result in iter_batch_filter(images, 'sharpen', workers=2)]
+        self.assertEqual(heights, [100 + i for i in range(10)])
+
+    def test_apply_filter_batch(self):
+        results = apply_filter_batch([self.image_bytes] * 3, 'rotate', workers=2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(Img.from_bytes(results[0]).image_data.shape, (660, 660, 3))
+
+    def test_preview_filters(self):
+        names = ['grayscale', 'emboss', 'cartoonize']
+        previews = preview_filters(self.image_bytes, names, max_side=300)
+        self.assertEqual(len(previews), 3)
+        self.assertEqual(Img.from_bytes(previews[0]).image_data.shape, (330, 330, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
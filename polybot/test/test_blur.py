@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+import os
+import cv2
+import numpy as np
+from polybot import img_proc
+from polybot.img_proc import GAUSSIAN_MAX_KERNEL, Img, gaussian_boxes
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def psnr(a, b):
+    mse = np.mean((np.float64(a) - np.float64(b)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+class TestImgBlur(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+
+    def test_small_kernels_are_exact(self):
+        np.testing.assert_array_equal(self.img.blur(), cv2.GaussianBlur(self.img.image_data, (17, 17), 0))
+        np.testing.assert_array_equal(self.img.blur(GAUSSIAN_MAX_KERNEL),
+                                      cv2.GaussianBlur(self.img.image_data, (31, 31), 0))
+
+    def test_large_kernels_approximate_the_gaussian(self):
+        for blur_level in [40, 101, 201]:
+            expected = cv2.GaussianBlur(self.img.image_data, (blur_level | 1, blur_level | 1), 0)
+            self.assertGreater(psnr(self.img.blur(blur_level), expected), 45, blur_level)
+
+    def test_gaussian_boxes(self):
+        self.assertEqual(gaussian_boxes(33), [9, 11, 11])
+        for kernel_size in [33, 75, 151]:
+            widths = gaussian_boxes(kernel_size)
+            self.assertTrue(all(width % 2 == 1 for width in widths))
+            # the chain never reaches further than the Gaussian kernel it replaces
+            self.assertLessEqual(sum(width // 2 for width in widths), kernel_size // 2)
+
+    def test_modes(self):
+        data = self.img.image_data
+        np.testing.assert_array_equal(self.img.blur(9, mode='box'), cv2.blur(data, (9, 9)))
+        np.testing.assert_array_equal(self.img.blur(9, mode='median'), cv2.medianBlur(data, 9))
+        np.testing.assert_array_equal(self.img.blur(1, mode='median'), data)
+        stacked = self.img.blur(41, mode='stack')
+        self.assertEqual(stacked.shape, data.shape)
+        self.assertGreater(psnr(stacked, cv2.GaussianBlur(data, (41, 41), 0)), 25)
+
+    def test_invalid_mode(self):
+        self.assertIsNone(self.img.blur(5, mode='motion'))
+
+    def test_stack_mode_without_stack_blur(self):
+        # older OpenCV builds refuse the mode instead of silently blurring another way
+        with mock.patch.object(img_proc, 'cv2', mock.Mock(spec=['blur', 'GaussianBlur', 'medianBlur'])):
+            self.assertIsNone(self.img.blur(41, mode='stack'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import cv2
+import numpy as np
+from polybot.img_proc import CARTOONIZE_PRESETS, Img, quantize_lut
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def psnr(a, b):
+    mse = np.mean((np.float64(a) - np.float64(b)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+class TestCartoonize(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+
+    def test_exact_matches_original_filter(self):
+        gray = cv2.medianBlur(cv2.cvtColor(self.img.image_data, cv2.COLOR_BGR2GRAY), 7)
+        edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 9)
+        color = cv2.bilateralFilter(self.img.image_data, 9, 300, 300)
+        expected = cv2.bitwise_and(color, color, mask=edges)
+        np.testing.assert_array_equal(self.img.cartoonize('exact'), expected)
+
+    def test_presets_stay_close_to_exact(self):
+        exact = self.img.cartoonize('exact')
+        for quality, min_psnr in [('high', 33), ('balanced', 32), ('fast', 18)]:
+            result = self.img.cartoonize(quality)
+            self.assertEqual(result.shape, exact.shape)
+            self.assertEqual(result.dtype, np.uint8)
+            self.assertGreater(psnr(result, exact), min_psnr, quality)
+
+    def test_odd_sizes(self):
+        # sizes that are not whole downsampling blocks are padded and cropped back
+        img = Img.from_array(self.img.image_data[:301, :203])
+        for quality in CARTOONIZE_PRESETS:
+            self.assertEqual(img.cartoonize(quality).shape, (301, 203, 3))
+
+    def test_edges_are_shared(self):
+        results = self.img.apply_many({'cartoonize': {'quality': 'high'}, 'oil_painting': {}})
+        np.testing.assert_array_equal(results['cartoonize'], self.img.cartoonize('high'))
+
+    def test_quantized_colors(self):
+        result = self.img.cartoonize('fast')
+        self.assertLessEqual(len(np.unique(result)), CARTOONIZE_PRESETS['fast']['levels'] + 1)
+        lut = quantize_lut(4)
+        self.assertEqual(sorted(set(lut.tolist())), [32, 96, 160, 224])
+
+    def test_unknown_quality(self):
+        self.assertIsNone(self.img.cartoonize('best'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import cv2
+import numpy as np
+from polybot.img_proc import Img, concat_images, concat_layout
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestConcatEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+        cls.small = cv2.resize(cls.img.image_data, (200, 330))
+
+    def test_same_size_matches_numpy(self):
+        data = self.img.image_data
+        np.testing.assert_array_equal(self.img.concat(data), np.concatenate((data, data), axis=1))
+        np.testing.assert_array_equal(self.img.concat(data, 'vertical'), np.concatenate((data, data), axis=0))
+
+    def test_resize_to_common_height(self):
+        result = self.img.concat([self.small, self.img.image_data])
+        # the 660x660 images shrink to the 330 rows of the small one, keeping their aspect ratio
+        self.assertEqual(result.shape, (330, 330 + 200 + 330, 3))
+        np.testing.assert_array_equal(result[:, 330:530], self.small)
+        np.testing.assert_array_equal(result[:, :330], cv2.resize(self.img.image_data, (330, 330),
+                                                                  interpolation=cv2.INTER_AREA))
+
+    def test_pad_to_common_width(self):
+        result = self.img.concat(self.small, 'vertical', fit='pad', background=255)
+        self.assertEqual(result.shape, (660 + 330, 660, 3))
+        np.testing.assert_array_equal(result[660:, 230:430], self.small)
+        self.assertTrue((result[660:, :230] == 255).all())
+        self.assertTrue((result[660:, 430:] == 255).all())
+
+    def test_grid(self):
+        result = self.img.concat([self.img.image_data] * 4, 'grid')
+        self.assertEqual(result.shape, (2 * 660, 3 * 660, 3))
+        np.testing.assert_array_equal(result[660:, 660:1320], self.img.image_data)
+        # the last cell of the second row stays empty
+        self.assertTrue((result[660:, 1320:] == 0).all())
+
+        _, placements = concat_layout([(660, 660), (330, 200)], 'grid', columns=1)
+        # cells are 330x200, the square image is fitted inside its cell and centered
+        self.assertEqual(placements, [(65, 0, 200, 200), (330, 0, 330, 200)])
+
+    def test_preallocated_output(self):
+        out = np.empty((330, 530, 3), np.uint8)
+        self.assertIs(Img.from_array(self.small).concat(self.img.image_data, out=out), out)
+        self.assertIsNone(self.img.concat(self.small, out=np.empty((10, 10, 3), np.uint8)))
+
+    def test_invalid_arguments(self):
+        self.assertIsNone(self.img.concat(self.small, 'diagonal'))
+        self.assertIsNone(self.img.concat(self.small, fit='crop'))
+        self.assertIsNone(self.img.concat([self.small, None]))
+
+    def test_concat_images_decodes_reduced(self):
+        large = cv2.resize(self.img.image_data, (2640, 2640))
+        _, large_bytes = cv2.imencode('.jpg', large)
+        _, small_bytes = cv2.imencode('.jpg', self.small)
+        result = Img.from_bytes(concat_images(large_bytes.tobytes(), small_bytes.tobytes(), self.img.encode()))
+        self.assertEqual(result.image_data.shape, (330, 330 + 200 + 330, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import cv2
+import numpy as np
+from polybot.img_proc import Img, apply_filter, concat_images, encoding_for, is_flat, is_gray
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgEncode(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(img_path, 'rb') as f:
+            cls.image_bytes = f.read()
+        cls.img = Img(img_path)
+
+    def test_from_bytes_matches_imread(self):
+        np.testing.assert_array_equal(Img.from_bytes(self.image_bytes).image_data, self.img.image_data)
+
+    def test_from_buffer(self):
+        img = Img.from_bytes(memoryview(self.image_bytes))
+        self.assertEqual(img.image_data.shape, self.img.image_data.shape)
+
+    def test_from_array(self):
+        img = Img.from_array(self.img.image_data)
+        self.assertIs(img.image_data, self.img.image_data)
+        self.assertEqual(Img.from_bytes(img.encode(format='png')).image_data.shape, self.img.image_data.shape)
+
+    def test_invalid_bytes(self):
+        self.assertIsNone(Img.from_bytes(b'not an image').image_data)
+
+    def test_png_round_trip_is_lossless(self):
+        encoded = self.img.encode(format='png')
+        self.assertTrue(encoded.startswith(b'\x89PNG'))
+        np.testing.assert_array_equal(Img.from_bytes(encoded).image_data, self.img.image_data)
+
+    def test_jpeg_quality(self):
+        high = self.img.encode(format='jpg', quality=95)
+        low = self.img.encode(format='jpg', quality=20)
+        self.assertTrue(high.startswith(b'\xff\xd8'))
+        self.assertLess(len(low), len(high))
+
+    def test_encode_float_result(self):
+        encoded = self.img.encode(np.float64(self.img.image_data) * 0.5, format='png')
+        decoded = Img.from_bytes(encoded).image_data
+        self.assertEqual(int(decoded.max()), int(self.img.image_data.max()) // 2)
+
+    def test_rotate_without_file(self):
+        rotated = Img.from_bytes(self.image_bytes).rotate()
+        np.testing.assert_array_equal(rotated, cv2.rotate(self.img.image_data, cv2.ROTATE_180))
+
+    def test_apply_filter(self):
+        result = Img.from_bytes(apply_filter(self.image_bytes, 'invert_colors'))
+        self.assertEqual(result.image_data.shape, self.img.image_data.shape)
+
+    def test_concat_images(self):
+        result = Img.from_bytes(concat_images(self.image_bytes, self.image_bytes))
+        height, width = self.img.image_data.shape[:2]
+        self.assertEqual(result.image_data.shape[:2], (height, 2 * width))
+
+    def test_target_bytes(self):
+        full = self.img.encode(quality=95)
+        target = len(full) // 3
+        encoded = self.img.encode(quality=95, target_bytes=target)
+        self.assertLessEqual(len(encoded), target)
+        # the highest quality within the budget is kept
+        self.assertGreater(len(encoded), len(self.img.encode(quality=40)))
+        self.assertEqual(self.img.encode(quality=95, target_bytes=len(full)), full)
+
+    def test_target_bytes_below_min_quality(self):
+        encoded = self.img.encode(quality=95, target_bytes=100, min_quality=30)
+        self.assertEqual(encoded, self.img.encode(quality=30))
+
+    def test_lossless_over_target_falls_back_to_jpeg(self):
+        encoded = self.img.encode(format='png', target_bytes=len(self.img.encode(quality=95)))
+        self.assertTrue(encoded.startswith(b'\xff\xd8'))
+
+    def test_subsampling(self):
+        full = self.img.encode(quality=90, subsampling='444')
+        reduced = self.img.encode(quality=90, subsampling='420')
+        self.assertLess(len(reduced), len(full))
+        self.assertIsNone(self.img.encode(subsampling='411x'))
+
+    def test_gray_single_channel(self):
+        gray = self.img.grayscale()
+        self.assertTrue(is_gray(gray))
+        self.assertFalse(is_gray(self.img.image_data))
+        decoded = cv2.imdecode(np.frombuffer(self.img.encode(gray, gray='auto'), np.uint8), cv2.IMREAD_UNCHANGED)
+        self.assertEqual(decoded.ndim, 2)
+        decoded = cv2.imdecode(np.frombuffer(self.img.encode(gray), np.uint8), cv2.IMREAD_UNCHANGED)
+        self.assertEqual(decoded.ndim, 3)
+
+    def test_auto_format(self):
+        flat = np.zeros((200, 300, 3), np.uint8)
+        flat[50:150, 100:200] = (0, 128, 255)
+        self.assertTrue(is_flat(flat))
+        self.assertFalse(is_flat(self.img.image_data))
+        self.assertTrue(self.img.encode(flat, format='auto').startswith(b'\x89PNG'))
+        self.assertTrue(self.img.encode(format='auto').startswith(b'\xff\xd8'))
+
+    def test_encoding_profiles(self):
+        self.assertEqual(encoding_for('sharpen')['subsampling'], '444')
+        self.assertIs(encoding_for('grayscale')['gray'], True)
+        self.assertEqual(encoding_for('sharpen', {'quality': 70})['quality'], 70)
+        self.assertEqual(encoding_for(None), encoding_for('unknown'))
+
+    def test_apply_filter_encoding(self):
+        result = apply_filter(self.image_bytes, 'grayscale')
+        self.assertEqual(cv2.imdecode(np.frombuffer(result, np.uint8), cv2.IMREAD_UNCHANGED).ndim, 2)
+        result = apply_filter(self.image_bytes, 'blur', encoding={'format': 'webp', 'quality': 80})
+        self.assertEqual(result[8:12], b'WEBP')
+
+
+if __name__ == '__main__':
+    unittest.main()
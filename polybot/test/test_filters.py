@@ -0,0 +1,100 @@
+import unittest
+import os
+from unittest import mock
+import numpy as np
+from polybot.filters import FilterRegistry, FilterSpec, Param, default_registry
+from polybot.img_proc import Img, apply_filter
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def sepia(img, strength=1.0):
+    kernel = np.array([[0.131, 0.534, 0.272], [0.168, 0.686, 0.349], [0.189, 0.769, 0.393]])
+    return np.uint8(np.clip(img.image_data @ (kernel * strength).T, 0, 255))
+
+
+SEPIA = FilterSpec('sepia', sepia, "Old photo tones.", params=[Param('strength', float, 1.0, 0, 2)])
+
+
+class FakeEntryPoint:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def load(self):
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+class TestFilterRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = default_registry()
+
+    def test_names_and_aliases(self):
+        spec, params = self.registry.parse('Salt and Pepper')
+        self.assertEqual((spec.target, params), ('salt_n_pepper', {}))
+        self.assertIs(self.registry.parse('NOISE')[0], spec)
+        self.assertIs(self.registry.get('invert   colors'), self.registry.get('negative'))
+        self.assertEqual(self.registry.parse('hello there'), (None, None))
+
+    def test_parameters(self):
+        self.assertEqual(self.registry.parse('blur 5')[1], {'blur_level': 5})
+        self.assertEqual(self.registry.parse('blur 40 median')[1], {'blur_level': 40, 'mode': 'median'})
+        self.assertEqual(self.registry.parse('Oil Painting dynratio=0.1')[1], {'dynRatio': 0.1})
+        self.assertEqual(self.registry.parse('oil painting 9 0.3')[1], {'size': 9, 'dynRatio': 0.3})
+        self.assertEqual(self.registry.parse('cartoonize fast')[1], {'quality': 'fast'})
+
+    def test_invalid_parameters(self):
+        for text in ['blur 500', 'blur soft', 'blur 5 6', 'cartoonize best', 'oil painting radius=3']:
+            with self.assertRaises(ValueError):
+                self.registry.parse(text)
+
+    def test_matches(self):
+        self.assertTrue(self.registry.matches('Grayscale'))
+        self.assertTrue(self.registry.matches('salt and pepper 0.2'))
+        self.assertFalse(self.registry.matches('salt'))
+        self.assertFalse(self.registry.matches(None))
+
+    def test_help_text(self):
+        text = self.registry.help_text()
+        self.assertEqual(len(text.splitlines()), len(self.registry))
+        self.assertIn("- Blur: Reduce noise and detail. (blur_level: 1-201, mode: gaussian/box/median/stack)", text)
+
+    def test_cost_and_resolution(self):
+        self.assertTrue(self.registry.get('segment').heavy)
+        self.assertFalse(self.registry.get('blur').heavy)
+        self.assertEqual(self.registry.get('segment').resolution, {'max_side': 640, 'upsample': True})
+        self.assertEqual(self.registry.get('blur').resolution, {})
+
+    def test_name_conflicts(self):
+        with self.assertRaises(ValueError):
+            self.registry.register(FilterSpec('soften', 'blur', aliases=['blur']))
+        # the same name replaces the filter and drops its old aliases
+        self.registry.register(FilterSpec('grayscale', 'grayscale'))
+        self.assertIsNone(self.registry.get('gray'))
+
+    def test_entry_points(self):
+        points = [FakeEntryPoint('sepia', SEPIA), FakeEntryPoint('broken', ImportError('missing'))]
+        registry = FilterRegistry()
+        with mock.patch('polybot.filters.entry_points', return_value=points):
+            self.assertEqual(registry.load_entry_points(), [SEPIA])
+        self.assertIs(registry.parse('sepia 0.5')[0], SEPIA)
+
+    def test_plugin_runs_through_apply_filter(self):
+        with open(img_path, 'rb') as f:
+            image_bytes = f.read()
+        result = Img.from_bytes(apply_filter(image_bytes, SEPIA.target, strength=0.5))
+        self.assertEqual(result.image_data.shape, Img(img_path).image_data.shape)
+
+    def test_in_place_filters(self):
+        img = Img(img_path)
+        expected = img.invert_colors()
+        result = img.invert_colors(in_place=True)
+        self.assertIs(result, img.image_data)
+        np.testing.assert_array_equal(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+import requests
+from loadtest.fake_telegram import FakeTelegramAPI, make_update
+from loadtest.replay_load import EXPECTED_REPLY, generate_traffic, load_traffic, percentiles, report, save_traffic
+
+
+class TestLoadHarness(unittest.TestCase):
+
+    def test_traffic_is_seeded(self):
+        script = generate_traffic(20, 3, seed=7)
+        self.assertEqual(script, generate_traffic(20, 3, seed=7))
+        self.assertNotEqual(script, generate_traffic(20, 3, seed=8))
+        self.assertEqual(len(script), 60)
+        for interaction in script:
+            for command in interaction['commands']:
+                self.assertIn(command['kind'], EXPECTED_REPLY)
+
+    def test_traffic_mix(self):
+        script = generate_traffic(10, 2, mix={'concat': 1})
+        self.assertEqual({interaction['kind'] for interaction in script}, {'concat'})
+        # every interaction of a chat starts after the previous one
+        for first, second in zip(script[::2], script[1::2]):
+            self.assertLessEqual(first['at'], second['at'])
+
+    def test_save_and_load(self):
+        script = generate_traffic(5, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traffic.jsonl')
+            save_traffic(script, path)
+            self.assertEqual(load_traffic(path), script)
+
+    def test_percentiles(self):
+        stats = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertEqual((stats['p50'], stats['p90'], stats['p99'], stats['max']), (50, 90, 99, 100))
+        self.assertIsNone(percentiles([]))
+
+    def test_report(self):
+        results = [{'kind': 'filter', 'outcome': 'ok', 'latency': 0.5},
+                   {'kind': 'concat', 'outcome': 'ok', 'latency': 1.0},
+                   {'kind': 'filter', 'outcome': 'busy', 'latency': 0.01, 'reply': 'The bot is busy'},
+                   {'kind': 'filter', 'outcome': 'no_reply'}]
+        summary = report(results, 2.0)
+        self.assertEqual(summary['outcomes'], {'ok': 2, 'busy': 1, 'no_reply': 1})
+        self.assertEqual(summary['error_rate'], 0.5)
+        self.assertEqual(summary['completed_per_second'], 1.0)
+        self.assertEqual(summary['latency_ms']['filter']['count'], 1)
+        self.assertEqual(summary['errors'], {'The bot is busy': 1, 'no_reply': 1})
+
+    def test_fake_api_long_polling(self):
+        api = FakeTelegramAPI()
+        api.start()
+        try:
+            url = f'{api.url}/bot123:fake/getUpdates'
+            threading.Timer(0.2, api.push_update, [make_update(1, 5, text='Blur')]).start()
+            start = time.time()
+            updates = requests.get(url, params={'offset': 0, 'timeout': 5}, timeout=10).json()['result']
+            self.assertEqual([update['update_id'] for update in updates], [1])
+            self.assertLess(time.time() - start, 1.5)
+            # confirmed updates are not handed out again
+            self.assertEqual(requests.get(url, params={'offset': 2}, timeout=10).json()['result'], [])
+            self.assertIsNone(api.wait_for_chat(5, 1, timeout=0.1))
+        finally:
+            api.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os
+import time
+import cv2
+from polybot.img_proc import apply_filter, collect_timings, timed
+from polybot.metrics import Metrics
+from polybot.result_cache import ResultCache
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class FakePool:
+    in_flight = 3
+    queue_depth = 1
+    timed_out = 2
+    recycled = 1
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        with open(img_path, 'rb') as f:
+            self.image_bytes = f.read()
+
+    def sample(self, name, **labels):
+        return self.metrics.registry.get_sample_value(name, labels)
+
+    def test_timed_stage(self):
+        with self.metrics.timed('download'):
+            self.assertEqual(self.sample('polybot_stage_in_flight', stage='download'), 1)
+        self.assertEqual(self.sample('polybot_stage_in_flight', stage='download'), 0)
+        self.assertEqual(self.sample('polybot_stage_seconds_count', stage='download', filter=''), 1)
+
+    def test_worker_timings(self):
+        result, observations = collect_timings(time.time(), apply_filter, self.image_bytes, 'blur')
+        self.assertIsNotNone(result)
+        self.metrics.record(observations)
+
+        height, width = cv2.imread(img_path).shape[:2]
+        for stage, filter_name in [('queue', ''), ('decode', ''), ('filter', 'blur'), ('encode', '')]:
+            self.assertEqual(self.sample('polybot_stage_seconds_count', stage=stage, filter=filter_name), 1)
+        self.assertAlmostEqual(self.sample('polybot_image_megapixels_sum'), height * width / 1e6)
+
+    def test_outside_a_job_nothing_is_collected(self):
+        with timed('filter', filter='blur'):
+            pass
+        _, observations = collect_timings(time.time(), lambda: None)
+        self.assertEqual([stage for _, _, stage in observations], [{'stage': 'queue'}])
+
+    def test_pool_and_cache_statistics(self):
+        cache = ResultCache()
+        cache.put('key', b'image')
+        cache.get('key')
+        cache.get('other')
+        self.metrics.watch(pool=FakePool(), cache=cache)
+
+        self.assertEqual(self.sample('polybot_pool_queue_depth'), 1)
+        self.assertEqual(self.sample('polybot_pool_timeouts_total'), 2)
+        self.assertEqual(self.sample('polybot_pool_recycles_total'), 1)
+        self.assertEqual(self.sample('polybot_cache_requests_total', result='hit'), 1)
+        self.assertEqual(self.sample('polybot_cache_hit_ratio'), 0.5)
+        body, content_type = self.metrics.render()
+        self.assertIn(b'polybot_cache_bytes{tier="memory"} 5.0', body)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import cv2
+import numpy as np
+from polybot.img_proc import Img
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def reference_oil_painting(image_data, size, bin_width):
+    # straightforward per-pixel version of the filter, with OpenCV's default reflected border
+    radius = size // 2
+    bins = cv2.cvtColor(image_data, cv2.COLOR_BGR2GRAY) // bin_width
+    padded_bins = cv2.copyMakeBorder(bins, radius, radius, radius, radius, cv2.BORDER_REFLECT_101)
+    padded = cv2.copyMakeBorder(image_data, radius, radius, radius, radius, cv2.BORDER_REFLECT_101)
+    result = np.empty_like(image_data)
+    for y in range(image_data.shape[0]):
+        for x in range(image_data.shape[1]):
+            window_bins = padded_bins[y:y + size, x:x + size].ravel()
+            window = padded[y:y + size, x:x + size].reshape((-1, 3))
+            dominant = np.argmax(np.bincount(window_bins))
+            mean = window[window_bins == dominant].mean(axis=0)
+            result[y, x] = np.floor(mean + 0.5)
+    return result
+
+
+class TestOilPainting(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+        cls.crop = Img.from_array(np.ascontiguousarray(cls.img.image_data[300:340, 100:150]))
+
+    def test_matches_reference(self):
+        for size, dynRatio in [(3, 0.2), (7, 0.1), (5, 0.05)]:
+            bin_width = int(round(dynRatio * 255))
+            expected = reference_oil_painting(self.crop.image_data, size, bin_width)
+            actual = self.crop.oil_painting(size, dynRatio, method='histogram')
+            np.testing.assert_allclose(actual, expected, atol=1)
+
+    def test_large_window(self):
+        # windows over 255 pixels count in 16 bits, and over 257 pixels sum colors in 32 bits
+        expected = reference_oil_painting(self.crop.image_data, 19, 51)
+        np.testing.assert_allclose(self.crop.oil_painting(19, method='histogram'), expected, atol=1)
+
+    def test_parameters_change_the_result(self):
+        default = self.img.oil_painting(method='histogram')
+        self.assertEqual(default.shape, self.img.image_data.shape)
+        self.assertFalse(np.array_equal(default, self.img.oil_painting(size=11, method='histogram')))
+        self.assertFalse(np.array_equal(default, self.img.oil_painting(dynRatio=0.05, method='histogram')))
+
+    def test_even_size_is_rounded_up(self):
+        np.testing.assert_array_equal(self.crop.oil_painting(4, method='histogram'),
+                                      self.crop.oil_painting(5, method='histogram'))
+
+    def test_unknown_method(self):
+        self.assertIsNone(self.crop.oil_painting(method='gpu'))
+
+    @unittest.skipUnless(hasattr(cv2, 'xphoto'), "opencv-contrib is not installed")
+    def test_xphoto_backend(self):
+        result = self.img.oil_painting(method='xphoto')
+        self.assertEqual(result.shape, self.img.image_data.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
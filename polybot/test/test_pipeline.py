@@ -0,0 +1,63 @@
+import unittest
+import cv2
+import numpy as np
+from polybot.img_proc import Img, SHARPEN_KERNEL, EMBOSS_KERNEL
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgPipeline(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+
+    def test_single_steps_match_img_methods(self):
+        np.testing.assert_array_equal(self.img.pipeline().blur().run(), self.img.blur())
+        np.testing.assert_array_equal(self.img.pipeline().sharpen().run(), self.img.sharpen())
+        np.testing.assert_array_equal(self.img.pipeline().invert_colors().run(), self.img.invert_colors())
+        np.testing.assert_array_equal(self.img.pipeline().grayscale().run(), self.img.grayscale())
+        np.testing.assert_array_equal(self.img.pipeline().rotate().run(), self.img.rotate())
+
+    def test_large_blur_matches_img_blur(self):
+        np.testing.assert_array_equal(self.img.pipeline().blur(201).run(), self.img.blur(201))
+        expected = cv2.bitwise_not(self.img.blur(101))
+        np.testing.assert_array_equal(self.img.pipeline().blur(101).invert_colors().run(), expected)
+
+    def test_blur_then_invert(self):
+        expected = cv2.bitwise_not(self.img.blur(5))
+        np.testing.assert_array_equal(self.img.pipeline().blur(5).invert_colors().run(), expected)
+
+    def test_point_ops_are_folded(self):
+        pipeline = self.img.pipeline().invert_colors().invert_colors()
+        self.assertEqual(len(pipeline.compile()), 1)
+        np.testing.assert_array_equal(pipeline.run(), self.img.image_data)
+
+    def test_kernels_are_merged(self):
+        pipeline = self.img.pipeline().sharpen().emboss()
+        compiled = pipeline.compile()
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(compiled[0][1].shape, (5, 5))
+
+        # The fused pass matches the unclipped sequential result away from the borders
+        data = np.float32(self.img.image_data)
+        expected = cv2.filter2D(cv2.filter2D(data, -1, np.float32(SHARPEN_KERNEL)), -1, np.float32(EMBOSS_KERNEL))
+        expected = np.uint8(np.clip(np.round(expected), 0, 255))
+        actual = pipeline.run()
+        diff = np.abs(np.int16(actual[4:-4, 4:-4]) - np.int16(expected[4:-4, 4:-4]))
+        self.assertLessEqual(int(diff.max()), 1)
+
+    def test_source_is_not_modified(self):
+        original = self.img.image_data.copy()
+        self.img.pipeline().blur().sharpen().invert_colors().run()
+        np.testing.assert_array_equal(self.img.image_data, original)
+
+    def test_empty_pipeline_returns_copy(self):
+        result = self.img.pipeline().run()
+        np.testing.assert_array_equal(result, self.img.image_data)
+        self.assertIsNot(result, self.img.image_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
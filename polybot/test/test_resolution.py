@@ -0,0 +1,49 @@
+import unittest
+from polybot.img_proc import Img, apply_filter, image_size, reduction_for
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgResolution(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(img_path, 'rb') as f:
+            cls.image_bytes = f.read()
+
+    def test_image_size(self):
+        self.assertEqual(image_size(self.image_bytes), (660, 660))
+        img = Img.from_bytes(self.image_bytes)
+        png = img.encode(img.image_data[:100], format='png')
+        self.assertEqual(image_size(png), (660, 100))
+        self.assertIsNone(image_size(b'not an image'))
+
+    def test_reduction_for(self):
+        self.assertEqual(reduction_for((4000, 3000), 500), 8)
+        self.assertEqual(reduction_for((4000, 3000), 1000), 4)
+        self.assertEqual(reduction_for((4000, 3000), 1280), 2)
+        self.assertEqual(reduction_for((4000, 3000), 2560), 1)
+
+    def test_reduced_decode(self):
+        img = Img.from_bytes(self.image_bytes, max_side=300)
+        self.assertEqual(img.reduce, 2)
+        self.assertEqual(img.image_data.shape, (330, 330, 3))
+
+    def test_no_reduction_below_max_side(self):
+        img = Img.from_bytes(self.image_bytes, max_side=1000)
+        self.assertEqual(img.reduce, 1)
+        self.assertEqual(img.image_data.shape, (660, 660, 3))
+
+    def test_apply_filter_at_reduced_scale(self):
+        result = Img.from_bytes(apply_filter(self.image_bytes, 'invert_colors', max_side=150))
+        self.assertEqual(result.image_data.shape, (165, 165, 3))
+
+    def test_apply_filter_upsampled(self):
+        result = Img.from_bytes(apply_filter(self.image_bytes, 'segment', max_side=150, upsample=True,
+                                             num_clusters=8, sample_size=2000))
+        self.assertEqual(result.image_data.shape, (660, 660, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
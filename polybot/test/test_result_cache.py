@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import time
+from polybot.result_cache import ResultCache, make_key
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_make_key(self):
+        self.assertEqual(make_key('AQAD', 'blur', {'blur_level': 16}), make_key('AQAD', 'blur', {'blur_level': 16}))
+        self.assertNotEqual(make_key('AQAD', 'blur'), make_key('AQAD', 'rotate'))
+        self.assertNotEqual(make_key('AQAD', 'blur', {'blur_level': 16}), make_key('AQAD', 'blur', {'blur_level': 8}))
+        self.assertEqual(make_key(b'image', 'blur'), make_key(bytearray(b'image'), 'blur'))
+
+    def test_hit_and_miss(self):
+        cache = ResultCache()
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', b'result')
+        self.assertEqual(cache.get('key'), b'result')
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.hit_ratio, 0.5)
+
+    def test_lru_eviction_by_size(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        cache.get('a')
+        cache.put('c', b'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertEqual(cache.get('c'), b'cccc')
+        self.assertLessEqual(cache.memory_bytes, 10)
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_oversized_value_is_not_cached(self):
+        cache = ResultCache(max_bytes=4)
+        cache.put('a', b'too large')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.memory_bytes, 0)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb', ttl=60)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), b'bbbb')
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(max_bytes=4, directory=directory)
+            cache.put('a', b'aaaa')
+            cache.put('b', b'bbbb')
+            self.assertEqual(cache.get('a'), b'aaaa')
+            self.assertEqual(cache.stats['disk_hits'], 1)
+
+            # a new cache finds the entries written by the previous one
+            restarted = ResultCache(directory=directory)
+            self.assertEqual(restarted.get('b'), b'bbbb')
+            self.assertEqual(restarted.disk_bytes, 8)
+
+    def test_disk_tier_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(max_bytes=0, directory=directory, disk_max_bytes=10)
+            cache.put('a', b'aaaa')
+            cache.put('b', b'bbbb')
+            cache.put('c', b'cccc')
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('c'), b'cccc')
+            self.assertLessEqual(cache.disk_bytes, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
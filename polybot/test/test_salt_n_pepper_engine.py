@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from polybot.img_proc import Img
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgSaltNPepperEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.img = Img(img_path)
+        self.original = self.img.image_data.copy()
+
+    def fractions(self, noisy):
+        total = noisy.shape[0] * noisy.shape[1]
+        pepper = (noisy == 0).all(axis=2).sum() / total
+        salt = (noisy == 255).all(axis=2).sum() / total
+        return pepper, salt
+
+    def test_noise_fractions(self):
+        pepper, salt = self.fractions(self.img.salt_n_pepper(amount=0.1, seed=0))
+        self.assertAlmostEqual(pepper, 0.05, delta=0.005)
+        self.assertAlmostEqual(salt, 0.05, delta=0.005)
+
+    def test_exact_uint8_threshold(self):
+        pepper, salt = self.fractions(self.img.salt_n_pepper(amount=0.25, seed=0))
+        self.assertAlmostEqual(pepper, 0.125, delta=0.01)
+        self.assertAlmostEqual(salt, 0.125, delta=0.01)
+
+    def test_untouched_pixels(self):
+        noisy = self.img.salt_n_pepper(seed=0)
+        untouched = (noisy == self.original).all(axis=2).mean()
+        self.assertGreaterEqual(untouched, 0.94)
+        np.testing.assert_array_equal(self.img.image_data, self.original)
+
+    def test_seed_is_reproducible(self):
+        np.testing.assert_array_equal(self.img.salt_n_pepper(seed=7), self.img.salt_n_pepper(seed=7))
+        self.assertFalse(np.array_equal(self.img.salt_n_pepper(seed=7), self.img.salt_n_pepper(seed=8)))
+
+    def test_in_place(self):
+        expected = self.img.salt_n_pepper(seed=3)
+        noisy = self.img.salt_n_pepper(seed=3, in_place=True)
+        self.assertIs(noisy, self.img.image_data)
+        np.testing.assert_array_equal(noisy, expected)
+
+    def test_zero_and_full_amount(self):
+        np.testing.assert_array_equal(self.img.salt_n_pepper(amount=0), self.original)
+        pepper, salt = self.fractions(self.img.salt_n_pepper(amount=1, seed=0))
+        self.assertAlmostEqual(pepper + salt, 1.0)
+
+    def test_invalid_amount(self):
+        self.assertIsNone(self.img.salt_n_pepper(amount=1.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from polybot.img_proc import Img
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgSegmentFast(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+        cls.segmented = cls.img.segment(num_clusters=8, sample_size=2000, seed=0)
+
+    def test_segment_dimension(self):
+        self.assertEqual(self.segmented.shape, self.img.image_data.shape)
+        self.assertEqual(self.segmented.dtype, np.uint8)
+
+    def test_segment_palette_size(self):
+        colors = np.unique(self.segmented.reshape((-1, 3)), axis=0)
+        self.assertLessEqual(len(colors), 8)
+
+    def test_segment_darkened(self):
+        self.assertLessEqual(int(self.segmented.max()), 128)
+
+    def test_segment_close_to_original(self):
+        error = np.abs(np.float64(self.segmented) - np.float64(self.img.image_data) * 0.5).mean()
+        self.assertLess(error, 20)
+
+    def test_segment_seed_is_reproducible(self):
+        again = self.img.segment(num_clusters=8, sample_size=2000, seed=0)
+        np.testing.assert_array_equal(self.segmented, again)
+
+    def test_segment_strided_sampling(self):
+        segmented = self.img.segment(num_clusters=8, sample_size=2000, sampling='strided')
+        self.assertEqual(segmented.shape, self.img.image_data.shape)
+
+    def test_segment_exact_path(self):
+        segmented = self.img.segment(num_clusters=4, method='exact', attempts=1, max_iter=10)
+        self.assertEqual(segmented.shape, self.img.image_data.shape)
+        self.assertLessEqual(len(np.unique(segmented.reshape((-1, 3)), axis=0)), 4)
+
+    def test_segment_invalid_method(self):
+        self.assertIsNone(self.img.segment(method='slow'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import threading
+import time
+import fakeredis
+from polybot.session_store import InMemorySessionStore, RedisSessionStore
+
+
+class SessionStoreContract:
+    # the same behavior is expected from every session store
+
+    def make_store(self, ttl=60):
+        raise NotImplementedError
+
+    def test_get_set_delete(self):
+        store = self.make_store()
+        self.assertIsNone(store.get(1))
+        store.set(1, {'concat_pending': {'file_id': 'a'}})
+        self.assertEqual(store.get(1), {'concat_pending': {'file_id': 'a'}})
+        store.delete(1)
+        self.assertIsNone(store.get(1))
+
+    def test_states_are_copies(self):
+        store = self.make_store()
+        store.set(1, {'album': {'photos': []}})
+        store.get(1)['album']['photos'].append('changed')
+        self.assertEqual(store.get(1), {'album': {'photos': []}})
+
+    def test_update_returns_previous_state(self):
+        store = self.make_store()
+        self.assertIsNone(store.update(1, lambda state: {'count': 1}))
+        self.assertEqual(store.update(1, lambda state: {'count': state['count'] + 1}), {'count': 1})
+        self.assertEqual(store.get(1), {'count': 2})
+        self.assertEqual(store.update(1, lambda state: None), {'count': 2})
+        self.assertIsNone(store.get(1))
+
+    def test_concat_handshake_is_atomic(self):
+        # of many photos arriving at once, every pending one is consumed by exactly one other
+        store = self.make_store()
+        pairs = []
+
+        def register_photo(state):
+            return None if state and 'concat_pending' in state else {'concat_pending': 'photo'}
+
+        def send_photo():
+            previous = store.update(1, register_photo)
+            pairs.append(bool(previous and 'concat_pending' in previous))
+
+        threads = [threading.Thread(target=send_photo) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(pairs.count(True), 10)
+        self.assertIsNone(store.get(1))
+
+    def test_expiry(self):
+        store = self.make_store(ttl=1)
+        store.set(1, {'concat_pending': 'photo'})
+        time.sleep(1.2)
+        self.assertIsNone(store.get(1))
+
+
+class TestInMemorySessionStore(SessionStoreContract, unittest.TestCase):
+
+    def make_store(self, ttl=60):
+        return InMemorySessionStore(ttl=ttl)
+
+    def test_expired_states_are_cleaned_up(self):
+        expired = []
+        store = InMemorySessionStore(ttl=0.05, on_expire=lambda chat_id, state: expired.append(chat_id))
+        store.set(1, {'concat_pending': 'a'})
+        store.set(2, {'concat_pending': 'b'})
+        time.sleep(0.1)
+        self.assertEqual(store.purge(), 2)
+        self.assertEqual(expired, [1, 2])
+        self.assertEqual(len(store), 0)
+
+    def test_lru_eviction(self):
+        evicted = []
+        store = InMemorySessionStore(max_entries=2, on_expire=lambda chat_id, state: evicted.append(chat_id))
+        store.set(1, {})
+        store.set(2, {})
+        store.update(1, lambda state: {'touched': True})
+        store.set(3, {})
+        self.assertEqual(evicted, [2])
+        self.assertIsNone(store.get(2))
+        self.assertEqual(store.get(1), {'touched': True})
+
+
+class TestRedisSessionStore(SessionStoreContract, unittest.TestCase):
+
+    def make_store(self, ttl=60):
+        return RedisSessionStore(fakeredis.FakeRedis(), ttl=ttl)
+
+    def test_shared_between_replicas(self):
+        server = fakeredis.FakeServer()
+        first = RedisSessionStore(fakeredis.FakeRedis(server=server))
+        second = RedisSessionStore(fakeredis.FakeRedis(server=server))
+        first.set(1, {'concat_pending': 'photo'})
+        self.assertEqual(second.update(1, lambda state: None), {'concat_pending': 'photo'})
+        self.assertIsNone(first.get(1))
+
+    def test_keys_have_ttl(self):
+        client = fakeredis.FakeRedis()
+        RedisSessionStore(client, ttl=900).set(1, {})
+        self.assertGreater(client.ttl('polybot:session:1'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
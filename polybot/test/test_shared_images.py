@@ -0,0 +1,128 @@
+import unittest
+import os
+import pickle
+import cv2
+import numpy as np
+from polybot.img_proc import Img, apply_filter_shared, decode_into
+from polybot.shared_images import MIN_SEGMENT_BYTES, SharedImagePool, attach
+from polybot.worker_pool import FilterWorkerPool
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+def fill(image, value):
+    image.array()[:] = value
+    return image.shape
+
+
+def crash(image):
+    os._exit(1)
+
+
+def to_gray(img):
+    return cv2.cvtColor(img.image_data, cv2.COLOR_BGR2GRAY)
+
+
+class TestSharedImages(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(img_path, 'rb') as f:
+            cls.image_bytes = f.read()
+        cls.img = Img(img_path)
+
+    def setUp(self):
+        self.images = SharedImagePool(max_bytes=8 * MIN_SEGMENT_BYTES)
+        self.workers = FilterWorkerPool(max_workers=1, max_queue=4, timeout=30)
+
+    def tearDown(self):
+        self.workers.shutdown(wait=True)
+        self.images.close()
+
+    def test_worker_writes_in_place(self):
+        image = self.images.acquire((100, 200, 3))
+        self.assertEqual(pickle.loads(pickle.dumps(image)).shape, (100, 200, 3))
+        self.assertEqual(self.workers.submit('chat', fill, image, 7).result(timeout=30), (100, 200, 3))
+        self.assertTrue((image.array() == 7).all())
+
+    def test_apply_filter_shared(self):
+        source = decode_into(self.image_bytes, self.images.acquire)
+        np.testing.assert_array_equal(source.array(), self.img.image_data)
+        target = self.images.acquire(source.shape)
+        job = self.workers.submit('chat', apply_filter_shared, source, target, 'invert_colors', in_place=True,
+                                  resources=[source, target])
+        self.assertEqual(job.result(timeout=30), source.shape)
+        np.testing.assert_array_equal(target.array(), 255 - self.img.image_data)
+        self.assertEqual(self.images.in_use, 0)
+
+    def test_in_place_filter_keeps_the_source(self):
+        source = self.images.from_array(self.img.image_data)
+        target = self.images.acquire(source.shape)
+        # a job resubmitted after its worker was recycled reads the same source again
+        for _ in range(2):
+            self.assertEqual(apply_filter_shared(source, target, 'invert_colors', in_place=True), source.shape)
+            np.testing.assert_array_equal(target.array(), 255 - self.img.image_data)
+        np.testing.assert_array_equal(source.array(), self.img.image_data)
+
+    def test_result_not_fitting_target_is_returned(self):
+        source = self.images.from_array(self.img.image_data)
+        target = self.images.acquire(source.shape)
+        result = apply_filter_shared(source, target, to_gray)
+        np.testing.assert_array_equal(result, to_gray(self.img))
+
+    def test_tiled_filter_writes_into_target(self):
+        large = cv2.resize(self.img.image_data, (2400, 1800))
+        images = SharedImagePool()
+        try:
+            source, target = images.from_array(large), images.acquire(large.shape)
+            self.assertEqual(apply_filter_shared(source, target, 'cartoonize', quality='fast'), large.shape)
+            np.testing.assert_array_equal(target.array(), Img.from_array(large).cartoonize('fast'))
+        finally:
+            images.close()
+
+    def test_segments_are_reused(self):
+        first = self.images.acquire((100, 100, 3))
+        name = first.name
+        first.release()
+        first.release()
+        self.assertEqual(self.images.in_use, 0)
+        second = self.images.acquire((200, 200, 3))
+        self.assertEqual(second.name, name)
+        self.assertEqual(self.images.bytes, MIN_SEGMENT_BYTES)
+
+    def test_reference_counting(self):
+        image = self.images.acquire((10, 10))
+        image.retain()
+        image.release()
+        self.assertEqual(self.images.in_use, 1)
+        image.release()
+        self.assertEqual(self.images.in_use, 0)
+
+    def test_pool_limit_and_reclaim(self):
+        large = self.images.acquire((4 * MIN_SEGMENT_BYTES,))
+        small = [self.images.acquire((MIN_SEGMENT_BYTES,)) for _ in range(4)]
+        with self.assertRaises(MemoryError):
+            self.images.acquire((1,))
+        for image in small:
+            image.release()
+        # the free small segments are unlinked to make room for another large one
+        self.images.acquire((4 * MIN_SEGMENT_BYTES,))
+        self.assertEqual(self.images.bytes, 8 * MIN_SEGMENT_BYTES)
+        large.release()
+
+    def test_released_when_worker_crashes(self):
+        image = self.images.acquire((10, 10))
+        job = self.workers.submit('chat', crash, image, resources=[image])
+        with self.assertRaises(Exception):
+            job.result(timeout=30)
+        self.assertEqual(self.images.in_use, 0)
+
+    def test_close_unlinks_segments(self):
+        name = self.images.acquire((10, 10)).name
+        self.images.close()
+        with self.assertRaises(FileNotFoundError):
+            attach(name)
+
+
+if __name__ == '__main__':
+    unittest.main()
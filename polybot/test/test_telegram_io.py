@@ -0,0 +1,186 @@
+import unittest
+import json
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from polybot.telegram_io import TelegramAPIError, TelegramIO, photo_type
+
+TOKEN = 'TOKEN'
+FILE = bytes(range(256)) * 400
+
+
+class StubTelegram(BaseHTTPRequestHandler):
+    # answers with the next scripted failure for a path, then with the real response
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[-1]
+        with stub.lock:
+            stub.calls.append((method, body))
+            stub.active += 1
+            stub.max_active = max(stub.max_active, stub.active)
+            failure = stub.failures.get(method, []).pop(0) if stub.failures.get(method) else None
+        try:
+            time.sleep(stub.delay)
+            if failure == 429:
+                self.reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 0.1',
+                                 'parameters': {'retry_after': 0.1}})
+            elif failure is not None:
+                self.reply(failure, {'ok': False, 'error_code': failure, 'description': 'Bad Gateway'})
+            elif self.path.startswith(f'/file/bot{TOKEN}/'):
+                self.reply(200, stub.file, 'application/octet-stream')
+            elif method == 'getFile':
+                self.reply(200, {'ok': True, 'result': {'file_id': 'id', 'file_size': len(stub.file),
+                                                        'file_path': 'photos/file_0.jpg'}})
+            elif method == 'sendPhoto' or method == 'sendMediaGroup':
+                self.reply(200, {'ok': True, 'result': {'message_id': len(stub.calls)}})
+            else:
+                self.reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+        finally:
+            with stub.lock:
+                stub.active -= 1
+
+    def reply(self, status, payload, content_type='application/json'):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestTelegramIO(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTelegram)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.lock = threading.Lock()
+        self.calls = []
+        self.failures = {}
+        self.active = 0
+        self.max_active = 0
+        self.delay = 0
+        self.file = FILE
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.telegram = TelegramIO(TOKEN, f'http://127.0.0.1:{self.server.server_port}', backoff=0.01)
+
+    def tearDown(self):
+        self.telegram.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download_file(self):
+        self.assertEqual(bytes(self.telegram.download_file('id', chat_id=1)), FILE)
+        self.assertEqual([method for method, _ in self.calls], ['getFile', 'file_0.jpg'])
+
+    def test_retry_after_429(self):
+        self.failures['getFile'] = [429]
+        start = time.perf_counter()
+        self.assertEqual(self.telegram.get_file('id')['file_path'], 'photos/file_0.jpg')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_retry_on_server_error(self):
+        self.failures['file_0.jpg'] = [502, 500]
+        self.assertEqual(bytes(self.telegram.download('photos/file_0.jpg')), FILE)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.telegram.max_retries = 2
+        self.failures['sendPhoto'] = [500] * 3
+        with self.assertRaises(TelegramAPIError) as raised:
+            self.telegram.send_photo(1, b'photo')
+        self.assertEqual(raised.exception.status, 500)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_client_error_is_not_retried(self):
+        with self.assertRaises(TelegramAPIError) as raised:
+            self.telegram.call('unknownMethod', 1)
+        self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_failed_download_is_closed(self):
+        self.failures['file_0.jpg'] = [404]
+        responses = []
+        request = self.telegram.session.request
+
+        def recording_request(*args, **kwargs):
+            responses.append(request(*args, **kwargs))
+            return responses[-1]
+
+        self.telegram.session.request = recording_request
+        with self.assertRaises(TelegramAPIError):
+            self.telegram.download('photos/file_0.jpg')
+        self.assertTrue(responses[0].raw.closed)
+
+    def test_send_is_not_retried_after_read_timeout(self):
+        self.telegram.timeout = (5, 0.1)
+        self.delay = 0.3
+        with self.assertRaises(requests.Timeout):
+            self.telegram.send_photo(1, b'photo')
+        self.assertEqual(len(self.calls), 1)
+        # other calls are safe to repeat
+        self.telegram.max_retries = 1
+        with self.assertRaises(requests.Timeout):
+            self.telegram.get_file('id')
+        self.assertEqual(len(self.calls), 3)
+
+    def test_max_download(self):
+        self.telegram.max_download = len(FILE) - 1
+        with self.assertRaises(TelegramAPIError):
+            self.telegram.download('photos/file_0.jpg')
+
+    def test_send_photo(self):
+        self.telegram.send_photo(7, b'photo-bytes', caption='Blur')
+        method, body = self.calls[0]
+        self.assertEqual(method, 'sendPhoto')
+        for part in [b'photo-bytes', b'name="chat_id"', b'Blur']:
+            self.assertIn(part, body)
+
+    def test_photo_type(self):
+        self.assertEqual(photo_type(b'\x89PNG\r\n\x1a\n'), ('png', 'image/png'))
+        self.assertEqual(photo_type(b'RIFF\x00\x00\x00\x00WEBPVP8 '), ('webp', 'image/webp'))
+        self.assertEqual(photo_type(b'\xff\xd8\xff\xe0'), ('jpg', 'image/jpeg'))
+        self.telegram.send_photo(7, b'\x89PNG\r\n\x1a\n')
+        self.assertIn(b'filename="image.png"', self.calls[0][1])
+
+    def test_send_media_group(self):
+        self.telegram.send_media_group(7, [b'first-photo', b'second-photo'], ['One', 'Two'])
+        method, body = self.calls[0]
+        self.assertEqual(method, 'sendMediaGroup')
+        for part in [b'first-photo', b'second-photo', b'attach://photo0', b'attach://photo1']:
+            self.assertIn(part, body)
+
+    def test_per_chat_limit(self):
+        self.telegram.per_chat = 2
+        self.delay = 0.05
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: self.telegram.download('photos/file_0.jpg', chat_id=1), range(8)))
+        self.assertEqual(self.max_active, 2)
+        self.assertEqual(self.telegram._chats, {})
+
+    def test_global_limit(self):
+        telegram = TelegramIO(TOKEN, f'http://127.0.0.1:{self.server.server_port}', max_connections=3)
+        self.delay = 0.05
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda chat_id: telegram.download('photos/file_0.jpg', chat_id=chat_id), range(8)))
+        telegram.close()
+        self.assertEqual(self.max_active, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from polybot.img_proc import Img
+import os
+
+img_path = 'polybot/test/beatles.jpeg' if '/polybot/test' not in os.getcwd() else 'beatles.jpeg'
+
+
+class TestImgTiled(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.img = Img(img_path)
+        # a budget of a few dozen rows forces many strips on the 660x660 test image
+        cls.max_memory = cls.img.image_data[0].nbytes * 40
+
+    def assert_tiled_matches(self, filter_name, **kwargs):
+        expected = getattr(self.img, filter_name)(**kwargs)
+        actual = self.img.tiled(filter_name, max_memory=self.max_memory, **kwargs)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_blur(self):
+        self.assert_tiled_matches('blur')
+        self.assert_tiled_matches('blur', blur_level=31)
+        for mode in ['gaussian', 'box', 'median']:
+            self.assert_tiled_matches('blur', blur_level=60, mode=mode)
+        self.assertIsNone(self.img.tiled('blur', blur_level=60, mode='stack'))
+
+    def test_sharpen(self):
+        self.assert_tiled_matches('sharpen')
+
+    def test_emboss(self):
+        self.assert_tiled_matches('emboss')
+
+    def test_cartoonize(self):
+        self.assert_tiled_matches('cartoonize')
+        for quality in ['exact', 'high', 'fast']:
+            self.assert_tiled_matches('cartoonize', quality=quality)
+
+    def test_oil_painting(self):
+        self.assert_tiled_matches('oil_painting')
+        self.assert_tiled_matches('oil_painting', size=11)
+
+    def test_iter_tiles_covers_every_row(self):
+        rows = [(top, len(tile)) for top, tile in self.img.iter_tiles('sharpen', max_memory=self.max_memory)]
+        self.assertGreater(len(rows), 1)
+        self.assertEqual(rows[0][0], 0)
+        for (top, count), (next_top, _) in zip(rows, rows[1:]):
+            self.assertEqual(top + count, next_top)
+        self.assertEqual(rows[-1][0] + rows[-1][1], self.img.image_data.shape[0])
+
+    def test_tiled_into_preallocated_output(self):
+        out = np.zeros_like(self.img.image_data)
+        result = self.img.tiled('emboss', max_memory=self.max_memory, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, self.img.emboss())
+
+    def test_unsupported_filter(self):
+        self.assertIsNone(self.img.tiled('segment'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import os
+import tempfile
+import cv2
+import numpy as np
+from polybot.img_proc import Img, apply_filter_video, filter_frames, iter_frame_batches, iter_frames, write_frames
+
+
+def make_frames(count, height=120, width=160):
+    x = np.arange(width, dtype=np.float32)
+    return [np.uint8(np.dstack([(x + 8 * index) % 256 * np.ones((height, 1))] * 3) * [1, 0.5, 0.25])
+            for index in range(count)]
+
+
+def read_frames(video_bytes):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'video.mp4')
+        with open(path, 'wb') as f:
+            f.write(video_bytes)
+        return list(iter_frames(cv2.VideoCapture(path)))
+
+
+class TestVideo(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.frames = make_frames(12)
+        cls.video_path = os.path.join(cls.directory.name, 'clip.mp4')
+        write_frames(cls.frames, cls.video_path, fps=10)
+        with open(cls.video_path, 'rb') as f:
+            cls.video_bytes = f.read()
+        animation = cv2.Animation()
+        animation.frames = cls.frames
+        animation.durations = [100] * len(cls.frames)
+        gif_path = os.path.join(cls.directory.name, 'clip.gif')
+        cv2.imwriteanimation(gif_path, animation)
+        with open(gif_path, 'rb') as f:
+            cls.gif_bytes = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_iter_frames(self):
+        frames = list(iter_frames(cv2.VideoCapture(self.video_path)))
+        self.assertEqual(len(frames), len(self.frames))
+        self.assertLess(np.abs(np.int16(frames[5]) - self.frames[5]).mean(), 4)
+
+    def test_iter_frames_limits(self):
+        frames = list(iter_frames(cv2.VideoCapture(self.video_path), max_side=80, max_frames=5))
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(frames[0].shape, (60, 80, 3))
+
+    def test_iter_frame_batches(self):
+        batches = list(iter_frame_batches(cv2.VideoCapture(self.video_path), batch_memory=5 * self.frames[0].nbytes))
+        self.assertEqual([len(batch) for batch in batches], [5, 5, 2])
+        frames = list(iter_frames(cv2.VideoCapture(self.video_path)))
+        np.testing.assert_array_equal(np.concatenate(batches), np.stack(frames))
+        batches = list(iter_frame_batches(cv2.VideoCapture(self.video_path), max_side=80, max_frames=7))
+        self.assertEqual(sum(map(len, batches)), 7)
+        self.assertEqual(batches[0].shape[1:], (60, 80, 3))
+
+    def test_stacked_filters_match_frame_by_frame(self):
+        for name in ['invert_colors', 'grayscale']:
+            expected = [getattr(Img.from_array(frame.copy()), name)() for frame in self.frames]
+            stacked = list(filter_frames([np.stack(self.frames[:5]), np.stack(self.frames[5:])], name))
+            self.assertEqual(len(stacked), len(expected))
+            for result, reference in zip(stacked, expected):
+                np.testing.assert_array_equal(result, reference)
+
+    def test_filter_frames_window_is_bounded(self):
+        pulled = []
+
+        def frames():
+            for index in range(200):
+                pulled.append(index)
+                yield self.frames[index % len(self.frames)][np.newaxis]
+
+        for count, _ in enumerate(filter_frames(frames(), 'blur', workers=2, blur_level=3), 1):
+            self.assertLessEqual(len(pulled) - count, 4)
+        self.assertEqual(len(pulled), 200)
+
+    def test_apply_filter_video(self):
+        frames = read_frames(apply_filter_video(self.video_bytes, 'invert_colors'))
+        self.assertEqual(len(frames), len(self.frames))
+        self.assertLess(np.abs(np.int16(frames[3]) - (255 - self.frames[3])).mean(), 6)
+
+    def test_apply_filter_gif(self):
+        frames = read_frames(apply_filter_video(self.gif_bytes, 'blur', blur_level=5, max_side=80))
+        self.assertEqual(len(frames), len(self.frames))
+        self.assertEqual(frames[0].shape, (60, 80, 3))
+
+    def test_invalid_video(self):
+        self.assertIsNone(apply_filter_video(b'not a video', 'grayscale'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import asyncio
+import json
+import threading
+import time
+import telebot
+from aiohttp.test_utils import TestClient, TestServer
+from polybot.metrics import Metrics
+from polybot.webhook_server import WebhookServer
+
+
+def make_update(update_id, chat_id, text='Blur'):
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': text}})
+
+
+class FakeBot:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.processed = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def process_new_updates(self, updates):
+        self.release.wait()
+        time.sleep(self.delay)
+        self.processed.extend(update.update_id for update in updates)
+
+
+class TestWebhookServer(unittest.TestCase):
+
+    def run_with_client(self, server, scenario):
+        async def run():
+            async with TestClient(TestServer(server.make_app())) as client:
+                return await scenario(client)
+        return asyncio.run(run())
+
+    def test_update_is_processed(self):
+        bot = FakeBot()
+        server = WebhookServer(bot)
+
+        async def scenario(client):
+            response = await client.post('/webhook', data=make_update(1, 10))
+            self.assertEqual(response.status, 200)
+            await server.drain(5)
+
+        self.run_with_client(server, scenario)
+        self.assertEqual(bot.processed, [1])
+        self.assertEqual(server.in_flight, 0)
+
+    def test_secret_token(self):
+        server = WebhookServer(FakeBot(), secret_token='secret')
+
+        async def scenario(client):
+            rejected = await client.post('/webhook', data=make_update(1, 10))
+            accepted = await client.post('/webhook', data=make_update(2, 10),
+                                         headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+            await server.drain(5)
+            return rejected.status, accepted.status
+
+        self.assertEqual(self.run_with_client(server, scenario), (403, 200))
+
+    def test_invalid_update(self):
+        server = WebhookServer(FakeBot())
+
+        async def scenario(client):
+            return (await client.post('/webhook', data='not json')).status
+
+        self.assertEqual(self.run_with_client(server, scenario), 400)
+
+    def test_metrics_endpoint(self):
+        metrics = Metrics()
+        server = WebhookServer(FakeBot(), metrics=metrics)
+        metrics.watch(server=server)
+
+        async def scenario(client):
+            response = await client.get('/metrics')
+            return response.status, response.headers['Content-Type'], await response.text()
+
+        status, content_type, body = self.run_with_client(server, scenario)
+        self.assertEqual(status, 200)
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn('polybot_webhook_in_flight 0.0', body)
+
+    def test_backpressure(self):
+        bot = FakeBot()
+        bot.release.clear()
+        server = WebhookServer(bot, max_in_flight=2)
+
+        async def scenario(client):
+            statuses = [(await client.post('/webhook', data=make_update(i, i))).status for i in range(3)]
+            bot.release.set()
+            await server.drain(5)
+            return statuses
+
+        self.assertEqual(self.run_with_client(server, scenario), [200, 200, 503])
+        self.assertEqual(sorted(bot.processed), [0, 1])
+
+    def test_updates_of_one_chat_keep_their_order(self):
+        bot = FakeBot(delay=0.01)
+        server = WebhookServer(bot, handler_threads=8)
+
+        async def scenario(client):
+            for i in range(8):
+                await client.post('/webhook', data=make_update(i, 10))
+            await server.drain(5)
+
+        self.run_with_client(server, scenario)
+        self.assertEqual(bot.processed, list(range(8)))
+
+    def test_real_bot_handlers_run_in_the_server(self):
+        # handlers of a non-threaded TeleBot run on the server's threads: in order per chat, counted
+        # as in flight until they return, and waited for by drain
+        bot = telebot.TeleBot('123:fake', threaded=False)
+        processed = []
+        release = threading.Event()
+
+        @bot.message_handler(func=lambda message: True)
+        def handle(message):
+            release.wait(5)
+            time.sleep(0.01)
+            processed.append((message.message_id, threading.current_thread().name))
+
+        server = WebhookServer(bot, max_in_flight=4, handler_threads=4)
+
+        async def scenario(client):
+            statuses = [(await client.post('/webhook', data=make_update(i, 10))).status for i in range(5)]
+            in_flight = server.in_flight
+            release.set()
+            await server.drain(5)
+            return statuses, in_flight
+
+        statuses, in_flight = self.run_with_client(server, scenario)
+        self.assertEqual(statuses, [200, 200, 200, 200, 503])
+        self.assertEqual(in_flight, 4)
+        self.assertEqual([update_id for update_id, _ in processed], [0, 1, 2, 3])
+        self.assertTrue(all(name.startswith('update') for _, name in processed))
+
+    def test_stopping_server_refuses_updates(self):
+        server = WebhookServer(FakeBot())
+        server.stopping = True
+
+        async def scenario(client):
+            update = await client.post('/webhook', data=make_update(1, 10))
+            health = await client.get('/healthz')
+            return update.status, health.status
+
+        self.assertEqual(self.run_with_client(server, scenario), (503, 503))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import time
+from concurrent.futures import CancelledError
+from polybot.worker_pool import FilterWorkerPool, JobTimeoutError, PoolBusyError
+
+
+class TestFilterWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FilterWorkerPool(max_workers=1, max_queue=1, timeout=10)
+
+    def tearDown(self):
+        self.pool.shutdown(wait=True)
+
+    def test_result(self):
+        job = self.pool.submit('chat', pow, 2, 10)
+        self.assertEqual(job.result(timeout=10), 1024)
+
+    def test_callback(self):
+        results = []
+        job = self.pool.submit('chat', pow, 3, 2, callback=lambda job: results.append(job.result()))
+        job.result(timeout=10)
+        self.assertEqual(results, [9])
+
+    def test_error_is_propagated(self):
+        job = self.pool.submit('chat', int, 'not a number')
+        with self.assertRaises(ValueError):
+            job.result(timeout=10)
+
+    def test_busy_when_queue_is_full(self):
+        self.pool.submit('chat', time.sleep, 1)
+        self.pool.submit('chat', time.sleep, 1)
+        with self.assertRaises(PoolBusyError):
+            self.pool.submit('chat', time.sleep, 1)
+
+    def test_heavy_jobs_leave_room_for_cheap_ones(self):
+        # 2 slots, of which heavy jobs may take one
+        self.pool.submit('chat', time.sleep, 1, heavy=True)
+        with self.assertRaises(PoolBusyError):
+            self.pool.submit('chat', time.sleep, 1, heavy=True)
+        job = self.pool.submit('chat', pow, 2, 3)
+        self.assertEqual(job.result(timeout=10), 8)
+
+    def test_timeout(self):
+        job = self.pool.submit('chat', time.sleep, 2, timeout=0.2)
+        with self.assertRaises(JobTimeoutError):
+            job.result(timeout=10)
+
+    def test_cancel(self):
+        running = self.pool.submit('chat', time.sleep, 1)
+        queued = self.pool.submit('chat', time.sleep, 1)
+        self.assertEqual(self.pool.cancel('chat'), 2)
+        with self.assertRaises(CancelledError):
+            queued.result(timeout=10)
+        with self.assertRaises(CancelledError):
+            running.result(timeout=10)
+        self.assertEqual(self.pool.cancel('other chat'), 0)
+
+    def test_slots_are_released(self):
+        for _ in range(3):
+            self.pool.submit('chat', pow, 2, 2).result(timeout=10)
+        deadline = time.time() + 5
+        while self.pool.in_flight and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.in_flight, 0)
+
+    def test_resources_are_released_after_the_worker(self):
+        released = []
+
+        class Resource:
+            def release(self):
+                released.append(time.time())
+
+        start = time.time()
+        job = self.pool.submit('chat', time.sleep, 30, timeout=0.2, resources=[Resource()])
+        with self.assertRaises(JobTimeoutError):
+            job.result(timeout=10)
+        # the worker still used the resources when the job timed out, they are released once it was terminated
+        deadline = time.time() + 5
+        while not released and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(released), 1)
+        self.assertEqual(self.pool.recycled, 1)
+        self.assertLess(released[0] - start, 10)
+
+        self.pool.submit('chat', time.sleep, 1)
+        self.pool.submit('chat', time.sleep, 1)
+        with self.assertRaises(PoolBusyError):
+            self.pool.submit('chat', time.sleep, 1, resources=[Resource()])
+        self.assertEqual(len(released), 2)
+
+    def test_slow_callback_does_not_delay_other_jobs(self):
+        pool = FilterWorkerPool(max_workers=2, max_queue=4, timeout=10)
+        try:
+            start = time.time()
+            jobs = [pool.submit(i, time.sleep, 0.2, callback=lambda job: time.sleep(1)) for i in range(4)]
+            finished = []
+            for job in jobs:
+                job.result(timeout=10)
+                finished.append(time.time() - start)
+            self.assertLess(max(finished), 0.9)
+        finally:
+            pool.shutdown(wait=True)
+
+    def test_timed_out_job_gives_its_worker_back(self):
+        pool = FilterWorkerPool(max_workers=2, max_queue=2, timeout=0)
+        try:
+            hung = pool.submit('hung', time.sleep, 60, timeout=0.3)
+            other = pool.submit('other', pow, 2, 20)
+            running = pool.submit('running', time.sleep, 0.5)
+            queued = pool.submit('queued', pow, 3, 3)
+            with self.assertRaises(JobTimeoutError):
+                hung.result(timeout=10)
+            # the job that shared the terminated workers runs again, later jobs get a fresh worker
+            self.assertEqual(other.result(timeout=10), 2 ** 20)
+            self.assertIsNone(running.result(timeout=10))
+            self.assertEqual(queued.result(timeout=10), 27)
+            self.assertEqual(pool.submit('next', pow, 2, 2).result(timeout=10), 4)
+            self.assertEqual((pool.timed_out, pool.recycled), (1, 1))
+            deadline = time.time() + 5
+            while pool.in_flight and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(pool.in_flight, 0)
+        finally:
+            pool.shutdown(wait=True)
+
+
+    def test_resubmitted_job_gets_its_full_timeout(self):
+        pool = FilterWorkerPool(max_workers=2, max_queue=2, timeout=0)
+        try:
+            hung = pool.submit('hung', time.sleep, 60, timeout=0.3)
+            # killed along with the hung job's worker at 0.3 s, it then needs longer than its first window left
+            collateral = pool.submit('collateral', time.sleep, 0.4, timeout=0.6)
+            with self.assertRaises(JobTimeoutError):
+                hung.result(timeout=10)
+            self.assertIsNone(collateral.result(timeout=10))
+            self.assertEqual((pool.timed_out, pool.recycled), (1, 1))
+        finally:
+            pool.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from telebot import types
+
+
+class WebhookServer:
+    # Receives Telegram updates over HTTP and runs the bot's (blocking) handlers on a thread pool,
+    # so downloads and sends of different updates overlap while filters run in the worker processes.
+    # When too many updates are in flight it answers 503, and Telegram redelivers the update later.
+
+    def __init__(self, bot, path='/webhook', secret_token=None, max_in_flight=64, handler_threads=32, metrics=None):
+        self.bot = bot
+        # served on /metrics when given, anything with a render() returning (body, content type)
+        self.metrics = metrics
+        self.path = path
+        self.secret_token = secret_token
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.stopping = False
+        self._executor = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix='update')
+        self._chains = {}
+        self._idle = None
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        if self.metrics is not None:
+            app.router.add_get('/metrics', self.handle_metrics)
+        return app
+
+    async def handle_health(self, request):
+        status = 503 if self.stopping else 200
+        return web.json_response({'in_flight': self.in_flight, 'stopping': self.stopping}, status=status)
+
+    async def handle_metrics(self, request):
+        body, content_type = self.metrics.render()
+        # the content type carries parameters (version, charset), so it is passed as a raw header
+        return web.Response(body=body, headers={'Content-Type': content_type})
+
+    async def handle_update(self, request):
+        if self.secret_token and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret_token:
+            return web.Response(status=403)
+        if self.stopping or self.in_flight >= self.max_in_flight:
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        try:
+            update = types.Update.de_json(await request.text())
+        except Exception as e:
+            print(f"Error parsing update: {e}")
+            return web.Response(status=400)
+
+        # acknowledge right away, the handlers run in the background
+        self.in_flight += 1
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        self._idle.clear()
+
+        # updates of one chat are handled in the order they arrived, different chats overlap
+        key = self._chat_key(update)
+        task = asyncio.ensure_future(self._run(update, self._chains.get(key)))
+        self._chains[key] = task
+        task.add_done_callback(lambda task: self._update_done(key, task))
+        return web.Response(text='ok')
+
+    @staticmethod
+    def _chat_key(update):
+        message = update.message or update.edited_message
+        return message.chat.id if message is not None else ('update', update.update_id)
+
+    async def _run(self, update, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._process, update)
+
+    def _process(self, update):
+        try:
+            self.bot.process_new_updates([update])
+        except Exception as e:
+            print(f"Error processing update {update.update_id}: {e}")
+
+    def _update_done(self, key, task):
+        if self._chains.get(key) is task:
+            del self._chains[key]
+        self.in_flight -= 1
+        if self.in_flight == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def drain(self, timeout=30):
+        if self.in_flight and self._idle is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Stopping with {self.in_flight} update(s) still in flight")
+
+    async def serve(self, host='0.0.0.0', port=5000, webhook_url=None, shutdown_timeout=30):
+        loop = asyncio.get_running_loop()
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Webhook server listening on {host}:{port}{self.path}")
+
+        if webhook_url:
+            await loop.run_in_executor(self._executor, lambda: self.bot.set_webhook(
+                url=webhook_url, secret_token=self.secret_token))
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+
+        # Graceful shutdown: refuse new updates (Telegram retries them, possibly on another
+        # replica), let the running handlers finish, then close the listener
+        print("Shutting down webhook server")
+        self.stopping = True
+        await self.drain(shutdown_timeout)
+        await runner.cleanup()
+        self._executor.shutdown(wait=True)
+
+    def run(self, host='0.0.0.0', port=5000, webhook_url=None, shutdown_timeout=30):
+        asyncio.run(self.serve(host, port, webhook_url, shutdown_timeout))
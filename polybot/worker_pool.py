@@ -0,0 +1,243 @@
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+class JobTimeoutError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, callback=None, heavy=False, resources=(), call=None):
+        self.key = key
+        self.heavy = heavy
+        # released once the worker is done with the job, after its callback
+        self.resources = list(resources)
+        # (func, args, kwargs), submitted again when its worker is recycled under it
+        self.call = call
+        self.future = None
+        self.executor = None
+        self.timer = None
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._result = None
+        self._error = None
+
+    def done(self):
+        return self._finished.is_set()
+
+    def result(self, timeout=None):
+        if not self._finished.wait(timeout):
+            raise TimeoutError("Job is still running.")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self):
+        # Queued jobs never start; a job that is already running finishes in its worker,
+        # but its result is discarded
+        cancelled = self._finish(error=CancelledError())
+        if self.future is not None:
+            self.future.cancel()
+        return cancelled
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            if self._finished.is_set():
+                return False
+            self._result = result
+            self._error = error
+            self._finished.set()
+        if self.timer is not None:
+            self.timer.cancel()
+        if self._callback is not None:
+            try:
+                self._callback(self)
+            except Exception as e:
+                print(f"Error in job callback: {e}")
+        return True
+
+
+class FilterWorkerPool:
+    # A job that overruns its timeout cannot be stopped inside its worker, so the worker processes are
+    # recycled: the executor is replaced and its processes terminated, and the other jobs they were
+    # running or had queued are submitted again to the new one.
+
+    def __init__(self, max_workers=None, max_queue=None, timeout=60, max_heavy=None, callback_threads=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        self.timeout = timeout
+        # heavy jobs may take at most this many slots, the rest are kept for cheap ones
+        capacity = self.max_workers + self.max_queue
+        self.max_heavy = max(1, capacity * 3 // 4) if max_heavy is None else max_heavy
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        # Callbacks (sending results to Telegram) run on their own threads: done callbacks of the
+        # executor's futures run on its management thread, which also hands queued jobs to idle workers
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_threads or max(4, 2 * self.max_workers),
+                                             thread_name_prefix='job-callback')
+        # executors whose processes were terminated to stop a timed out job
+        self._retired = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._in_flight = 0
+        self._heavy_in_flight = 0
+        self._timed_out = 0
+        self._recycled = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queue_depth(self):
+        return max(0, self._in_flight - self.max_workers)
+
+    @property
+    def timed_out(self):
+        return self._timed_out
+
+    @property
+    def recycled(self):
+        # times the worker processes were replaced because a job overran its timeout
+        return self._recycled
+
+    def submit(self, key, func, *args, callback=None, timeout=None, heavy=False, resources=(), **kwargs):
+        # resources (e.g. shared images) have their release() called when the worker is done with
+        # the job or died, never earlier, even when the job timed out or was cancelled
+        with self._lock:
+            busy = None
+            if self._in_flight >= self.max_workers + self.max_queue:
+                busy = PoolBusyError("All workers are busy, please retry in a moment.")
+            elif heavy and self._heavy_in_flight >= self.max_heavy:
+                busy = PoolBusyError("Too many heavy filters are running, please retry in a moment.")
+            if busy is not None:
+                self._release_resources(resources)
+                raise busy
+            self._in_flight += 1
+            self._heavy_in_flight += heavy
+            job = Job(key, callback, heavy, resources, (func, args, kwargs))
+            self._jobs.setdefault(key, set()).add(job)
+
+        try:
+            self._submit(job)
+        except Exception:
+            self._release(job)
+            self._release_resources(job.resources)
+            raise
+
+        self._start_timer(job, self.timeout if timeout is None else timeout)
+        job.future.add_done_callback(lambda future: self._complete(job, future))
+        return job
+
+    def cancel(self, key):
+        with self._lock:
+            jobs = list(self._jobs.get(key, ()))
+        return sum(1 for job in jobs if job.cancel())
+
+    def shutdown(self, wait=True, cancel=True):
+        # with cancel=False the queued and running jobs still finish and run their callbacks
+        if cancel:
+            with self._lock:
+                jobs = [job for jobs in self._jobs.values() for job in jobs]
+            for job in jobs:
+                job.cancel()
+        self._executor.shutdown(wait=wait, cancel_futures=cancel)
+        self._callbacks.shutdown(wait=wait)
+
+    def _submit(self, job):
+        func, args, kwargs = job.call
+        executor = self._executor
+        try:
+            job.future = executor.submit(func, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed), replace the whole pool and retry once
+            print("Worker pool is broken, restarting it")
+            executor = self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            job.future = executor.submit(func, *args, **kwargs)
+        job.executor = executor
+
+    def _start_timer(self, job, timeout):
+        if timeout:
+            job.timer = threading.Timer(timeout, self._expire, (job, timeout))
+            job.timer.daemon = True
+            job.timer.start()
+
+    def _complete(self, job, future):
+        if (not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+                and job.executor in self._retired and not job.done()):
+            # its worker was terminated to stop another job, which timed out; it runs again with its
+            # full timeout, so it cannot time out for the time lost and recycle the new workers in turn
+            timeout = job.timer.interval if job.timer is not None else 0
+            if job.timer is not None:
+                job.timer.cancel()
+            try:
+                self._submit(job)
+                self._start_timer(job, timeout)
+                job.future.add_done_callback(lambda future: self._complete(job, future))
+                return
+            except Exception as e:
+                print(f"Error resubmitting job: {e}")
+        # Slots are released only when the worker is actually done, even for timed out jobs
+        self._release(job)
+        try:
+            self._callbacks.submit(self._deliver, job, future)
+        except RuntimeError:
+            # the pool is shut down
+            self._deliver(job, future)
+
+    def _deliver(self, job, future):
+        if future.cancelled():
+            job._finish(error=CancelledError())
+        elif future.exception() is not None:
+            job._finish(error=future.exception())
+        else:
+            job._finish(result=future.result())
+        resources, job.resources = job.resources, []
+        self._release_resources(resources)
+
+    @staticmethod
+    def _release_resources(resources):
+        for resource in resources:
+            try:
+                resource.release()
+            except Exception as e:
+                print(f"Error releasing job resource: {e}")
+
+    def _expire(self, job, timeout):
+        if not job._finish(error=JobTimeoutError(f"Job did not finish within {timeout} seconds.")):
+            return
+        with self._lock:
+            self._timed_out += 1
+        if not job.future.cancel() and not job.future.done():
+            self._recycle(job.executor)
+
+    def _recycle(self, executor):
+        # the job is running and would hold its worker until it finishes, however long that takes
+        with self._lock:
+            if executor is not self._executor:
+                return
+            print("A filter overran its timeout, restarting the worker processes")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._retired.add(executor)
+            self._recycled += 1
+        # _processes is internal to CPython's ProcessPoolExecutor, there is no public way to stop its workers
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    def _release(self, job):
+        with self._lock:
+            self._in_flight -= 1
+            self._heavy_in_flight -= job.heavy
+            jobs = self._jobs.get(job.key)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self._jobs[job.key]